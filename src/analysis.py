@@ -0,0 +1,124 @@
+import math
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Longest side of the downscaled proxy that borders are detected on
+PROXY_SIZE = 256
+
+
+def is_available() -> bool:
+    """Check whether NumPy, needed for border detection, is installed"""
+    return np is not None
+
+
+def make_proxy(image: Image.Image, max_side: int = PROXY_SIZE) -> Image.Image:
+    """
+    Downscale a page to a small grayscale proxy for analysis
+
+    Nearest-neighbour sampling only touches the pixels it keeps, so the cost
+    stays a few percent of decoding the page. Sampling noise is harmless here
+    because borders are detected from whole rows and columns.
+    """
+    scale = max_side / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.Resampling.NEAREST)
+    return image.convert('L')
+
+
+def find_content_box(image: Image.Image, tolerance: int = 24, min_content: float = 0.01,
+                     min_area: float = 0.5) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Detect uniform white or black margins around a page
+
+    Args:
+        image: Decoded page
+        tolerance: Grey-level difference from the border color that counts as content
+        min_content: Fraction of a proxy row/column that must be content for it to be kept
+        min_area: Refuse crops that would keep less than this fraction of the page
+
+    Returns:
+        (left, top, right, bottom) crop box in page coordinates, or None if there is nothing to trim
+    """
+    if np is None:
+        raise ImportError("Border trimming requires numpy")
+
+    proxy = make_proxy(image)
+    pixels = np.asarray(proxy, dtype=np.int16)
+    background = int(np.median([pixels[0, 0], pixels[0, -1], pixels[-1, 0], pixels[-1, -1]]))
+    if tolerance < background < 255 - tolerance:
+        # Only near-white and near-black margins are treated as borders
+        return None
+
+    content = np.abs(pixels - background) > tolerance
+    rows = np.flatnonzero(content.mean(axis=1) > min_content)
+    columns = np.flatnonzero(content.mean(axis=0) > min_content)
+    if rows.size == 0 or columns.size == 0:
+        return None
+
+    # Map back to page coordinates, keeping one proxy pixel of margin
+    scale_x = image.width / proxy.width
+    scale_y = image.height / proxy.height
+    left = max(0, int((columns[0] - 1) * scale_x))
+    top = max(0, int((rows[0] - 1) * scale_y))
+    right = min(image.width, int(math.ceil((columns[-1] + 2) * scale_x)))
+    bottom = min(image.height, int(math.ceil((rows[-1] + 2) * scale_y)))
+
+    if (left, top, right, bottom) == (0, 0, image.width, image.height):
+        return None
+    if (right - left) * (bottom - top) < min_area * image.width * image.height:
+        return None
+    return left, top, right, bottom
+
+
+def trim_borders(image: Image.Image, **options) -> Image.Image:
+    """Crop uniform margins from a page (returns the page unchanged if there are none)"""
+    box = find_content_box(image, **options)
+    return image.crop(box) if box else image
+
+
+def is_spread(image: Image.Image, spread_ratio: float = 1.2) -> bool:
+    """Check whether a page is a two-page spread (clearly wider than tall)"""
+    return image.width >= image.height * spread_ratio
+
+
+def split_spread(image: Image.Image, rtl: bool = False) -> List[Image.Image]:
+    """
+    Split a two-page spread into its halves in reading order
+
+    Args:
+        image: Decoded spread
+        rtl: Right-to-left reading order (manga): the right half comes first
+    """
+    middle = image.width // 2
+    left = image.crop((0, 0, middle, image.height))
+    right = image.crop((middle, 0, image.width, image.height))
+    return [right, left] if rtl else [left, right]
+
+
+def analyze_page(image: Image.Image, trim: bool = False, split: bool = False,
+                 rtl: bool = False) -> List[Image.Image]:
+    """
+    Run the page-analysis stage on a decoded page
+
+    Args:
+        image: Decoded page
+        trim: Crop uniform white/black borders
+        split: Split two-page spreads into single pages
+        rtl: Right-to-left reading order for split spreads
+
+    Returns:
+        The resulting pages in reading order (one, or two for a split spread)
+    """
+    if trim:
+        image = trim_borders(image)
+    if split and is_spread(image):
+        return split_spread(image, rtl)
+    return [image]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for pyComicConverter output settings and input reading.
+Run against a real comic to compare settings before changing defaults.
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import mapped_io
+from converter import _output_basename
+from mupdf_lock import MUPDF_LOCK
+from readers import open_reader
+from writers import PDF_SAVE_PROFILES, PdfWriter
+
+
+def time_to_first_page(pdf_path):
+    """Seconds from opening a PDF to having its first page rendered."""
+    with MUPDF_LOCK:
+        start = time.perf_counter()
+        document = fitz.open(pdf_path)
+        document.load_page(0).get_pixmap(matrix=fitz.Matrix(0.5, 0.5))
+        elapsed = time.perf_counter() - start
+        document.close()
+    return elapsed
+
+
+def benchmark_pdf_profiles(input_path, output_dir):
+    """Write the input with every PDF save profile and measure the results."""
+    with open_reader(input_path) as reader:
+        pages = list(reader.iter_pages())
+
+    results = []
+    for profile in PDF_SAVE_PROFILES:
+        pdf_path = os.path.join(output_dir, f"{_output_basename(input_path)}_{profile}.pdf")
+        writer = PdfWriter(pdf_path, lambda message: None, save=profile)
+        for index, page in enumerate(pages):
+            page.index = index
+            writer.add_page(page)
+
+        start = time.perf_counter()
+        writer.close()
+        save_time = time.perf_counter() - start
+
+        results.append({
+            'profile': profile,
+            'size': os.path.getsize(pdf_path),
+            'save_time': save_time,
+            'first_page_time': time_to_first_page(pdf_path),
+        })
+    return results
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unavailable)."""
+    # ru_maxrss survives exec on Linux, so prefer the per-address-space high-water mark
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _read_pages(input_path, use_mmap):
+    """Read every page the way a conversion does: hash it and parse its image header."""
+    mapped_io.USE_MMAP = use_mmap
+    baseline = _peak_rss_mb()
+    page_bytes = 0
+    start = time.perf_counter()
+    with open_reader(input_path) as reader:
+        for page in reader.iter_pages():
+            hashlib.sha1(page.data)
+            with Image.open(mapped_io.open_buffer(page.data)) as img:
+                img.size
+            page_bytes += len(page.data)
+    elapsed = time.perf_counter() - start
+    return {
+        'bytes': page_bytes,
+        'seconds': elapsed,
+        'baseline_rss': baseline,
+        'peak_rss': _peak_rss_mb(),
+    }
+
+
+def benchmark_reading(input_path):
+    """Compare reading pages through memory maps with plain buffered reads."""
+    # Warm the page cache so neither mode pays for the first read from disk
+    if os.path.isfile(input_path):
+        with open(input_path, 'rb') as source:
+            while source.read(1024 * 1024):
+                pass
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for mode, use_mmap in (('buffered', False), ('mmap', True)):
+        # A fresh interpreter per mode, so peak RSS isn't carried over
+        with context.Pool(1) as pool:
+            result = pool.apply(_read_pages, (input_path, use_mmap))
+        result['mode'] = mode
+        results.append(result)
+    return results
+
+
+def main():
+    """Main benchmark routine."""
+    parser = argparse.ArgumentParser(description="Benchmark pyComicConverter output settings")
+    parser.add_argument("filePath", help="Comic file or image folder to benchmark with")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.filePath):
+        print(f"[FAIL] Input not found: {args.filePath}")
+        sys.exit(1)
+
+    print("PDF save profiles")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = benchmark_pdf_profiles(args.filePath, output_dir)
+
+    print(f"{'Profile':<12} {'Size':>14} {'Save (s)':>10} {'First page (s)':>15}")
+    for result in results:
+        print(f"{result['profile']:<12} {result['size']:>14,} {result['save_time']:>10.3f} "
+              f"{result['first_page_time']:>15.3f}")
+
+    print()
+    print("Page reading (mapped pages count towards RSS once touched)")
+    print("=" * 50)
+    print(f"{'Mode':<12} {'Pages (MB)':>10} {'Time (s)':>10} {'MB/s':>10} {'Peak RSS (MB)':>14} {'Baseline':>10}")
+    for result in benchmark_reading(args.filePath):
+        megabytes = result['bytes'] / (1024 * 1024)
+        rate = megabytes / result['seconds'] if result['seconds'] else 0
+        peak = f"{result['peak_rss']:.1f}" if result['peak_rss'] is not None else "n/a"
+        baseline = f"{result['baseline_rss']:.1f}" if result['baseline_rss'] is not None else "n/a"
+        print(f"{result['mode']:<12} {megabytes:>10.1f} {result['seconds']:>10.3f} {rate:>10.1f} "
+              f"{peak:>14} {baseline:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
-import fitz  # PyMuPDF
 import io
-import tempfile
 import os
-import shutil
-import zipfile
+import time
 from PIL import Image
 from typing import Callable, Optional, List
 
+from mapped_io import open_buffer
+from metadata import parse_comicinfo, remap_pages, update_comicinfo
+from readers import Page, get_reader_class, open_reader, open_source, is_image_folder, supported_extensions
+from page_order import is_image_name
+from writers import open_stream_writer, open_writer, output_path_for, reencode_page
+from profiles import ProfileWorker, parse_profiles
+from dedupe import DuplicateIndex
+from verify import verify_output
+from scheduler import BatchScheduler, CostModel, estimate_job, order_jobs, schedule_report
+
 
 class ConversionProgress:
     """Class to track and report conversion progress"""
@@ -17,6 +24,7 @@ class ConversionProgress:
         self.success_count = 0
         self.error_count = 0
         self.errors = []
+        self.schedule = None
     
     def update(self, operation: str, file_index: int = None):
         """Update progress with current operation"""
@@ -40,16 +48,30 @@ class ConversionProgress:
         return int((self.current_file / self.total_files) * 100)
 
 
-def convert_single_file(file_path: str, output_dir: str, output_type: str, 
-                       progress_callback: Optional[Callable[[ConversionProgress], None]] = None) -> bool:
+def convert_single_file(file_path, output_dir, output_type, 
+                       progress_callback: Optional[Callable[[ConversionProgress], None]] = None,
+                       dedupe: Optional[str] = None, duplicate_index: Optional[DuplicateIndex] = None,
+                       verify: bool = False) -> bool:
     """
-    Convert a single PDF or CBZ file
+    Convert a single comic file (PDF, CBZ, CBR, CB7, CBT) or image folder
+    
+    The input is read and decoded once; every page is fanned out to each
+    output profile, whose transforms and writer run on their own thread, so
+    several outputs cost one decode plus one encode per profile.
     
     Args:
-        file_path: Path to input file
-        output_dir: Directory to save output
-        output_type: 'pdf' or 'cbz'
+        file_path: Path to input file or image folder, the input's bytes, or a
+            readable binary stream (e.g. sys.stdin.buffer)
+        output_dir: Directory to save output, or a writable binary stream (it
+            need not be seekable) to write a single output profile to
+        output_type: 'cbz', 'pdf', 'epub' or 'images', several as a comma-separated string,
+            or a list of output type strings and OutputProfile objects
         progress_callback: Optional callback for progress updates
+        dedupe: 'flag' to report near-duplicate pages, 'remove' to also drop them
+        duplicate_index: Index to check pages against (share one across calls for
+            library-wide detection and a combined report); a per-book index is used if omitted
+        verify: Re-read every output once written and check its page count, zip CRCs,
+            image headers and PDF xref table (outputs written to a stream are not verified)
     
     Returns:
         True if successful, False otherwise
@@ -61,38 +83,118 @@ def convert_single_file(file_path: str, output_dir: str, output_type: str,
         if progress_callback:
             progress_callback(progress)
     
-    file_extension = os.path.splitext(file_path)[1].lower()
+    basename = _output_basename(file_path)
+    book = os.path.basename(os.path.normpath(file_path)) if isinstance(file_path, str) else basename
+    if not isinstance(file_path, str):
+        file_path = open_source(file_path)
+    
+    reader_class = get_reader_class(file_path)
+    if reader_class is None:
+        extension = os.path.splitext(file_path)[1].lower() if isinstance(file_path, str) else "stream"
+        progress.add_error(f"Unsupported file format: {extension}")
+        return False
+    
+    try:
+        profiles = parse_profiles(output_type)
+    except ValueError as e:
+        progress.add_error(str(e))
+        return False
+    
+    to_stream = not isinstance(output_dir, str)
+    if to_stream and len(profiles) != 1:
+        progress.add_error("Only one output profile can be written to a stream")
+        return False
+    if not to_stream and isinstance(file_path, str) and any(
+            os.path.abspath(output_path_for(output_dir, basename + profile.suffix, profile.output_type))
+            == os.path.abspath(file_path) for profile in profiles):
+        progress.add_error(f"Output would overwrite the input: {file_path}")
+        return False
+    
+    if dedupe not in (None, 'flag', 'remove'):
+        progress.add_error(f"Unknown dedupe mode: {dedupe}")
+        return False
+    if dedupe and duplicate_index is None:
+        duplicate_index = DuplicateIndex()
+    if duplicate_index is not None:
+        duplicate_index.start_book(book)
     
-    # Create temp directory for images in current folder
-    temp_dir = tempfile.mkdtemp()
-    update_progress(f"Processing: {os.path.basename(file_path)}")
+    update_progress(f"Processing: {basename}")
+    workers = []
     
     try:
-        if file_extension == '.pdf':
-            update_progress("Extracting images from PDF...")
-            success = _extract_pdf_images(file_path, temp_dir, update_progress)
-            if not success:
+        with open_reader(file_path) as reader:
+            page_total = reader.page_count()
+            if page_total == 0:
+                update_progress(f"No image files found in {reader.format_name} input")
                 return False
+            
+            update_progress(f"Found {page_total} images in {reader.format_name} input")
+            
+            for profile in profiles:
+                if to_stream:
+                    writer = open_stream_writer(profile.output_type, output_dir, update_progress,
+                                                **profile.writer_options)
+                else:
+                    writer = open_writer(profile.output_type, output_dir, basename + profile.suffix,
+                                         update_progress, **profile.writer_options)
+                workers.append(ProfileWorker(profile, writer))
+            
+            update_progress(f"Converting {reader.format_name} to "
+                            f"{', '.join(profile.name for profile in profiles)}...")
+            
+            # Decode each page at most once, then fan it out to every profile
+            needs_image = reader.reencode_pages or any(profile.transforms_pages for profile in profiles)
+            needs_source = any(not profile.transforms_pages for profile in profiles)
+            
+            image_counter = 0
+            for source_index, name, read_page in reader.iter_page_entries():
+                try:
+                    # Read inside the try, so one damaged page doesn't fail the whole book
+                    page = read_page()
+                    image = _decode_page(page.data) if needs_image else None
+                    if duplicate_index is not None and _is_duplicate(duplicate_index, book, page,
+                                                                     image, update_progress):
+                        if dedupe == 'remove':
+                            continue
+                    if needs_source:
+                        prepared = _prepare_page(page, image_counter, image if reader.reencode_pages else None)
+                    else:
+                        prepared = Page(image_counter, page.name, page.data)
+                    prepared.image = image
+                except Exception as e:
+                    update_progress(f"Error processing image {name}: {str(e)}")
+                    continue
                 
-        elif file_extension == '.cbz':
-            update_progress("Extracting images from CBZ...")
-            success = _extract_cbz_images(file_path, temp_dir, update_progress)
-            if not success:
+                for worker in workers:
+                    worker.submit(prepared, image, source_index)
+                image_counter += 1
+            
+            for worker in workers:
+                worker.finish()
+            
+            if image_counter == 0:
+                update_progress("No images could be extracted")
+                _abort_workers(workers)
                 return False
-        else:
-            progress.add_error(f"Unsupported file format: {file_extension}")
-            return False
+            
+            comicinfo_data = reader.read_comicinfo()
+            if comicinfo_data is not None:
+                source_pages = parse_comicinfo(comicinfo_data).get('Pages', [])
+                for worker in workers:
+                    # Split spreads, removed duplicates and unreadable pages renumber a profile's pages
+                    worker.writer.set_comicinfo(update_comicinfo(comicinfo_data, {
+                        'PageCount': str(worker.pages_written),
+                        'Pages': remap_pages(source_pages, worker.page_map),
+                    }))
         
-        # Create output file
-        if output_type.lower() == "cbz":
-            update_progress("Creating CBZ archive...")
-            success = _create_cbz(file_path, temp_dir, output_dir, update_progress)
-        elif output_type.lower() == "pdf":
-            update_progress("Creating PDF document...")
-            success = _create_pdf(file_path, temp_dir, output_dir, update_progress)
-        else:
-            progress.add_error(f"Unsupported output type: {output_type}")
-            return False
+        success = True
+        for worker in workers:
+            if not worker.writer.close():
+                success = False
+        written, workers = workers, []
+        
+        if success and verify and not to_stream:
+            success = _verify_outputs(written, update_progress)
         
         if success:
             progress.add_success()
@@ -101,44 +203,85 @@ def convert_single_file(file_path: str, output_dir: str, output_type: str,
         return success
         
     except Exception as e:
-        progress.add_error(f"Error processing {file_path}: {str(e)}")
+        _abort_workers(workers)
+        progress.add_error(f"Error processing {book}: {str(e)}")
+        update_progress(f"Error processing {book}: {str(e)}")
         return False
-        
-    finally:
-        # Clean up temp directory
-        update_progress("Cleaning up temporary files...")
-        shutil.rmtree(temp_dir)
 
 
 def convert_multiple_files(file_paths: List[str], output_dir: str, output_type: str,
-                          progress_callback: Optional[Callable[[ConversionProgress], None]] = None) -> ConversionProgress:
+                          progress_callback: Optional[Callable[[ConversionProgress], None]] = None,
+                          dedupe: Optional[str] = None,
+                          duplicate_index: Optional[DuplicateIndex] = None,
+                          jobs: int = 1, memory_budget: Optional[int] = None,
+                          cost_model: Optional[CostModel] = None,
+                          verify: bool = False) -> ConversionProgress:
     """
     Convert multiple files
     
+    Files are estimated from their container metadata (size and page count)
+    and started largest first, so the longest book never holds up the end of
+    the run; with several jobs, a book only starts while its predicted memory
+    fits in the budget.
+    
     Args:
         file_paths: List of file paths to convert
         output_dir: Directory to save outputs
-        output_type: 'pdf' or 'cbz'
+        output_type: Output type(s), as accepted by convert_single_file
         progress_callback: Optional callback for progress updates
+        dedupe: Duplicate page handling, as accepted by convert_single_file
+        duplicate_index: Index shared by every file (pass DuplicateIndex(library_wide=True)
+            to match pages across books); a per-book index is used if omitted
+        jobs: Number of files to convert in parallel
+        memory_budget: Bytes of predicted memory that running jobs may use together
+        cost_model: Model used to predict each file's cost (defaults to CostModel())
+        verify: Verify every output once written, as in convert_single_file
     
     Returns:
-        ConversionProgress object with results
+        ConversionProgress object with results; progress.schedule holds predicted
+        vs. actual times per file and a cost model refitted to this run
     """
     progress = ConversionProgress(len(file_paths))
+    cost_model = cost_model or CostModel()
     
-    for i, file_path in enumerate(file_paths):
-        progress.update(f"Processing file {i+1}/{len(file_paths)}: {os.path.basename(file_path)}", i)
+    try:
+        in_memory_output = any(profile.output_type == 'pdf' for profile in parse_profiles(output_type))
+    except ValueError:
+        in_memory_output = False
+    estimates = [estimate_job(file_path, cost_model, in_memory_output) for file_path in file_paths]
+    if duplicate_index is None:
+        estimates = order_jobs(estimates)
+    else:
+        # A shared duplicate index is filled in reading order, one book at a time
+        jobs = 1
+    
+    def on_start(estimate):
+        progress.update(f"Processing: {os.path.basename(estimate.path)} "
+                        f"(predicted {estimate.seconds:.1f}s, {progress.current_file}/{len(file_paths)} done)")
         if progress_callback:
             progress_callback(progress)
-        
-        try:
-            success = convert_single_file(file_path, output_dir, output_type)
-            if success:
-                progress.add_success()
-            else:
-                progress.add_error(f"Failed to convert {os.path.basename(file_path)}")
-        except Exception as e:
-            progress.add_error(f"Error processing {os.path.basename(file_path)}: {str(e)}")
+    
+    def on_finish(result):
+        progress.current_file += 1
+        name = os.path.basename(result.path)
+        if result.success:
+            progress.add_success()
+        elif result.error:
+            progress.add_error(f"Error processing {name}: {result.error}")
+        else:
+            progress.add_error(f"Failed to convert {name}")
+        progress.update(f"Finished {name} in {result.actual_seconds:.1f}s "
+                        f"(predicted {result.predicted_seconds:.1f}s)")
+        if progress_callback:
+            progress_callback(progress)
+    
+    def convert(file_path):
+        return convert_single_file(file_path, output_dir, output_type,
+                                   dedupe=dedupe, duplicate_index=duplicate_index, verify=verify)
+    
+    start = time.perf_counter()
+    results = BatchScheduler(jobs, memory_budget).run(estimates, convert, on_start, on_finish)
+    progress.schedule = schedule_report(results, cost_model, time.perf_counter() - start)
     
     progress.current_file = len(file_paths)
     progress.update("Batch conversion completed")
@@ -148,160 +291,92 @@ def convert_multiple_files(file_paths: List[str], output_dir: str, output_type:
     return progress
 
 
-def _extract_pdf_images(file_path: str, temp_dir: str, update_progress: Callable[[str], None]) -> bool:
-    """Extract images from PDF file"""
-    try:
-        comic_file = fitz.open(file_path)
-        image_counter = 0
-        extracted_xrefs = set()
-        
-        for page_index in range(len(comic_file)):
-            page = comic_file.load_page(page_index)
-            image_list = page.get_images(full=True)
-            
-            if image_list:
-                update_progress(f"Found {len(image_list)} images on page {page_index}")
-            
-            for img in image_list:
-                xref = img[0]
-                
-                if xref in extracted_xrefs:
-                    continue
-                
-                extracted_xrefs.add(xref)
-                base_image = comic_file.extract_image(xref)
-                image_bytes = base_image["image"]
-                
-                image_name = f"{image_counter:03d}.jpeg"
-                image_path = os.path.join(temp_dir, image_name)
-                with open(image_path, "wb") as image_file:
-                    image_file.write(image_bytes)
-                
-                image_counter += 1
-        
-        comic_file.close()
-        return image_counter > 0
-        
-    except Exception as e:
-        update_progress(f"Error extracting PDF images: {str(e)}")
-        return False
+def _decode_page(data) -> Image.Image:
+    """Decode a page image once so it can be shared by every output profile"""
+    img = Image.open(open_buffer(data))
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    img.load()
+    return img
 
 
-def _extract_cbz_images(file_path: str, temp_dir: str, update_progress: Callable[[str], None]) -> bool:
-    """Extract images from CBZ file"""
-    try:
-        image_counter = 0
-        
-        with zipfile.ZipFile(file_path, 'r') as cbz_file:
-            image_files = sorted([f for f in cbz_file.namelist() 
-                                if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'))])
-            
-            if not image_files:
-                update_progress("No image files found in CBZ archive")
-                return False
-            
-            update_progress(f"Found {len(image_files)} images in CBZ archive")
-            
-            for image_file in image_files:
-                try:
-                    image_data = cbz_file.read(image_file)
-                    
-                    image_name = f"{image_counter:03d}.jpeg"
-                    image_path = os.path.join(temp_dir, image_name)
-                    
-                    img = Image.open(io.BytesIO(image_data))
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        img = img.convert('RGB')
-                    img.save(image_path, 'JPEG', quality=95)
-                    
-                    image_counter += 1
-                    
-                except Exception as e:
-                    update_progress(f"Error processing image {image_file}: {str(e)}")
-                    continue
-        
-        return image_counter > 0
-        
-    except Exception as e:
-        update_progress(f"Error extracting CBZ images: {str(e)}")
+def _is_duplicate(duplicate_index: DuplicateIndex, book: str, page: Page,
+                  image: Optional[Image.Image], update_progress: Callable[[str], None]) -> bool:
+    """Check a page against the duplicate index, reporting any match"""
+    match = duplicate_index.check(book, page.index, page.data, image)
+    if match is None:
         return False
+    update_progress(f"Page {page.index} duplicates page {match[1]} of {match[0]}")
+    return True
 
 
-def _create_cbz(input_file_path: str, temp_dir: str, output_dir: str, update_progress: Callable[[str], None]) -> bool:
-    """Create CBZ file from images"""
-    try:
-        input_basename = os.path.splitext(os.path.basename(input_file_path))[0]
-        cbz_filename = f"{input_basename}.cbz"
-        cbz_path = os.path.join(output_dir, cbz_filename)
-        
-        with zipfile.ZipFile(cbz_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(temp_dir):
-                for file_name in sorted(files):
-                    file_path = os.path.join(root, file_name)
-                    arcname = os.path.relpath(file_path, temp_dir)
-                    zipf.write(file_path, arcname)
-        
-        update_progress(f"CBZ archive created: {cbz_path}")
-        return True
-        
-    except Exception as e:
-        update_progress(f"Error creating CBZ: {str(e)}")
-        return False
+def _prepare_page(page: Page, index: int, image: Optional[Image.Image]) -> Page:
+    """Number a page sequentially, re-encoding it to JPEG when a decoded image is given"""
+    if image is None:
+        page = Page(index, f"{index:03d}.{page.extension or 'jpeg'}", page.data)
+        if not is_image_name(page.name):
+            # Passed-through formats like JPEG 2000 that CBZ readers skip
+            return reencode_page(page)
+        return page
+    
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return Page(index, f"{index:03d}.jpeg", buffer.getvalue())
 
 
-def _create_pdf(input_file_path: str, temp_dir: str, output_dir: str, update_progress: Callable[[str], None]) -> bool:
-    """Create PDF file from images"""
-    try:
-        input_basename = os.path.splitext(os.path.basename(input_file_path))[0]
-        pdf_filename = f"{input_basename}.pdf"
-        pdf_path = os.path.join(output_dir, pdf_filename)
-        
-        image_files = sorted([f for f in os.listdir(temp_dir) 
-                            if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
-        
-        if not image_files:
-            update_progress("No images found for PDF creation")
-            return False
-        
-        pdf_doc = fitz.open()
-        
-        for image_file in image_files:
-            image_path = os.path.join(temp_dir, image_file)
-            try:
-                img = Image.open(image_path)
-                img_width, img_height = img.size
-                img.close()
-                
-                page_width = img_width * 72 / 96
-                page_height = img_height * 72 / 96
-                
-                page = pdf_doc.new_page(width=page_width, height=page_height)
-                page.insert_image(fitz.Rect(0, 0, page_width, page_height), filename=image_path)
-                
-            except Exception as e:
-                update_progress(f"Error adding image {image_file} to PDF: {str(e)}")
-                continue
-        
-        pdf_doc.save(pdf_path)
-        pdf_doc.close()
-        update_progress(f"PDF document created: {pdf_path}")
-        return True
-        
-    except Exception as e:
-        update_progress(f"Error creating PDF: {str(e)}")
-        return False
+def _verify_outputs(workers: List[ProfileWorker], update_progress: Callable[[str], None]) -> bool:
+    """Verify each written output against the number of pages its profile produced"""
+    success = True
+    for worker in workers:
+        if worker.profile.output_type == 'thumbnails':
+            continue
+        result = verify_output(worker.writer.output_path, worker.pages_written)
+        for problem in result.problems:
+            update_progress(f"Verification failed for {worker.writer.output_path}: {problem}")
+        success = success and result.ok
+    if success:
+        update_progress("Outputs verified")
+    return success
+
+
+def _abort_workers(workers: List[ProfileWorker]):
+    """Stop profile workers and discard their partially written outputs"""
+    for worker in workers:
+        try:
+            worker.finish()
+        except Exception:
+            pass
+        try:
+            worker.writer.abort()
+        except Exception:
+            pass
+
+
+def _output_basename(input_path) -> str:
+    """Base name for output files (folder inputs keep their full name, unnamed streams are 'comic')"""
+    if not isinstance(input_path, str):
+        name = getattr(input_path, 'name', None)
+        if not isinstance(name, str) or name.startswith('<'):
+            return "comic"
+        input_path = name
+    input_path = os.path.normpath(input_path)
+    if os.path.isdir(input_path):
+        return os.path.basename(input_path)
+    return os.path.splitext(os.path.basename(input_path))[0]
 
 
 def get_supported_files(directory: str) -> List[str]:
-    """Get list of supported files in directory"""
-    supported_extensions = ['.pdf', '.cbz']
+    """Get list of supported files (and image folders) in directory"""
+    supported = supported_extensions()
     files = []
     
     for filename in os.listdir(directory):
         file_path = os.path.join(directory, filename)
         if os.path.isfile(file_path):
             file_extension = os.path.splitext(filename)[1].lower()
-            if file_extension in supported_extensions:
+            if file_extension in supported:
                 files.append(file_path)
+        elif is_image_folder(file_path):
+            files.append(file_path)
     
-    return sorted(files)
\ No newline at end of file
+    return sorted(files)
@@ -0,0 +1,221 @@
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+import analysis
+from mapped_io import open_buffer
+from readers import open_reader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+HASH_METHODS = ('dhash', 'phash')
+
+# Default Hamming distance (out of 64 bits) under which two pages count as duplicates
+DEFAULT_THRESHOLD = 4
+
+
+def is_available() -> bool:
+    """Check whether NumPy, needed for perceptual hashing, is installed"""
+    return np is not None
+
+
+def _thumbnail(data: bytes, image: Optional[Image.Image]) -> Image.Image:
+    """Small grayscale version of a page, decoding in JPEG draft mode if not already decoded"""
+    if image is None:
+        image = Image.open(open_buffer(data))
+        # JPEG decoders can scale by 1/2..1/8 while decoding, skipping most of the work
+        image.draft('L', (analysis.PROXY_SIZE, analysis.PROXY_SIZE))
+    return analysis.make_proxy(image)
+
+
+def _bits_to_int(bits) -> int:
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+
+def dhash(thumbnail: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: sign of horizontal gradients on a (hash_size+1) x hash_size thumbnail"""
+    pixels = np.asarray(thumbnail.resize((hash_size + 1, hash_size), Image.Resampling.BOX), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT_MATRICES: Dict[int, 'np.ndarray'] = {}
+
+
+def _dct_matrix(size: int):
+    """Orthonormal DCT-II matrix, so a 2-D DCT is M @ X @ M.T"""
+    if size not in _DCT_MATRICES:
+        k = np.arange(size)[:, None]
+        n = np.arange(size)[None, :]
+        matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+        matrix[0] /= np.sqrt(2)
+        _DCT_MATRICES[size] = matrix
+    return _DCT_MATRICES[size]
+
+
+def phash(thumbnail: Image.Image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """Perceptual hash: low-frequency DCT coefficients of a 32x32 thumbnail compared to their median"""
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(thumbnail.resize((size, size), Image.Resampling.BOX), dtype=np.float64)
+    matrix = _dct_matrix(size)
+    low = (matrix @ pixels @ matrix.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low.flatten()[1:]))
+
+
+def page_hash(data: bytes, image: Optional[Image.Image] = None, method: str = 'dhash') -> int:
+    """
+    Perceptual hash of a page
+
+    Args:
+        data: Encoded page bytes
+        image: Already decoded page, if the conversion decoded it anyway
+        method: 'dhash' or 'phash'
+    """
+    if np is None:
+        raise ImportError("Duplicate detection requires numpy")
+    thumbnail = _thumbnail(data, image)
+    return phash(thumbnail) if method == 'phash' else dhash(thumbnail)
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Number of differing bits between two hashes"""
+    return (first ^ second).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance for fast near-match lookups"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value: int, key):
+        node = [value, key, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def find(self, value: int, threshold: int) -> Optional[Tuple[int, object]]:
+        """Closest stored (distance, key) within threshold, or None"""
+        best = None
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= threshold and (best is None or distance < best[0]):
+                best = (distance, node[1])
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return best
+
+
+class DuplicateIndex:
+    """
+    Perceptual-hash index of pages seen so far
+
+    With library_wide=False the hashes are forgotten at each new book, so
+    only repeats within a book are matched; the list of duplicates found is
+    kept across books either way so one report covers the whole run.
+    """
+
+    def __init__(self, library_wide: bool = False, threshold: int = DEFAULT_THRESHOLD,
+                 method: str = 'dhash'):
+        if method not in HASH_METHODS:
+            raise ValueError(f"Unknown hash method: {method} (choose from {', '.join(HASH_METHODS)})")
+        self.library_wide = library_wide
+        self.threshold = threshold
+        self.method = method
+        self.tree = BKTree()
+        self.duplicates = []
+
+    def start_book(self, book: str):
+        """Begin indexing a new book"""
+        if not self.library_wide:
+            self.tree = BKTree()
+
+    def check(self, book: str, page_index: int, data: bytes,
+              image: Optional[Image.Image] = None) -> Optional[Tuple[str, int]]:
+        """
+        Hash a page, record it, and report the earlier page it duplicates
+
+        Returns:
+            (book, page_index) of the matching earlier page, or None if the page is new
+        """
+        value = page_hash(data, image, self.method)
+        match = self.tree.find(value, self.threshold)
+        if match is None:
+            self.tree.add(value, (book, page_index))
+            return None
+        distance, (match_book, match_index) = match
+        self.duplicates.append({
+            'book': book,
+            'page': page_index,
+            'duplicate_of_book': match_book,
+            'duplicate_of_page': match_index,
+            'distance': distance,
+        })
+        return match_book, match_index
+
+    def report(self) -> Dict:
+        """Summary of the duplicates found, grouped by book"""
+        books = {}
+        for duplicate in self.duplicates:
+            books.setdefault(duplicate['book'], []).append(duplicate)
+        return {
+            'method': self.method,
+            'threshold': self.threshold,
+            'library_wide': self.library_wide,
+            'duplicate_count': len(self.duplicates),
+            'books': books,
+        }
+
+    def write_report(self, report_path: str):
+        """Write the duplicate report as JSON"""
+        with open(report_path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+def scan_library(file_paths: List[str], duplicate_index: DuplicateIndex,
+                 update_progress: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Find duplicate pages without converting anything
+
+    Pages are hashed from draft-mode thumbnails, so this is far cheaper than
+    a conversion run.
+
+    Args:
+        file_paths: Comic files or image folders to scan
+        duplicate_index: Index to fill (library_wide=True to match across books)
+        update_progress: Optional callback for progress messages
+
+    Returns:
+        The index's duplicate report
+    """
+    for file_path in file_paths:
+        book = os.path.basename(os.path.normpath(file_path))
+        duplicate_index.start_book(book)
+        try:
+            with open_reader(file_path) as reader:
+                for index, name, read_page in reader.iter_page_entries():
+                    try:
+                        duplicate_index.check(book, index, read_page().data)
+                    except Exception as e:
+                        if update_progress:
+                            update_progress(f"Error hashing page {name} of {book}: {str(e)}")
+        except Exception as e:
+            if update_progress:
+                update_progress(f"Error scanning {book}: {str(e)}")
+    return duplicate_index.report()
@@ -94,7 +94,11 @@ class ComicConverterGUI:
         ttk.Radiobutton(format_frame, text="PDF", variable=self.output_format, 
                        value="pdf").pack(side=tk.LEFT, padx=(0, 20))
         ttk.Radiobutton(format_frame, text="CBZ", variable=self.output_format, 
-                       value="cbz").pack(side=tk.LEFT)
+                       value="cbz").pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Radiobutton(format_frame, text="EPUB", variable=self.output_format, 
+                       value="epub").pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Radiobutton(format_frame, text="Images", variable=self.output_format, 
+                       value="images").pack(side=tk.LEFT)
         
         # Output directory
         ttk.Label(options_frame, text="Output Directory:").grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
@@ -143,11 +147,12 @@ class ComicConverterGUI:
     def add_files(self):
         """Open file dialog to add files"""
         files = filedialog.askopenfilenames(
-            title="Select PDF or CBZ files",
+            title="Select comic files",
             filetypes=[
-                ("Comic files", "*.pdf *.cbz"),
+                ("Comic files", "*.pdf *.cbz *.cbr *.cb7 *.cbt"),
                 ("PDF files", "*.pdf"),
                 ("CBZ files", "*.cbz"),
+                ("CBR/CB7/CBT files", "*.cbr *.cb7 *.cbt"),
                 ("All files", "*.*")
             ]
         )
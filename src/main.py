@@ -1,63 +1,424 @@
 import argparse
+import multiprocessing
 import os
-from converter import convert_single_file, get_supported_files
+import shutil
+import sys
+
+# PyMuPDF prints its messages to stdout by default, which would corrupt output written with -o -
+os.environ.setdefault("PYMUPDF_MESSAGE", "fd:2")
+
+from converter import convert_multiple_files, convert_single_file, get_supported_files
+from metadata import check_field_name, update_cbz_metadata
+from readers import is_image_folder, supported_extensions
+from profiles import parse_profile, parse_profiles
+from dedupe import DEFAULT_THRESHOLD, HASH_METHODS, DuplicateIndex, scan_library
+from dedupe import is_available as dedupe_available
+from thumbnails import parse_sizes, update_thumbnail_index
+from scheduler import CostModel, write_schedule_report
+from verify import expected_page_counts, find_outputs, verify_outputs
+from planner import plan_files, plan_report, write_plan_report
+from shards import (build_manifest, load_manifests, manifest_path_for, merge_manifests, parse_shard,
+                    select_shard, write_manifest, write_merged_report)
 
 def main():
     parser = argparse.ArgumentParser(description="Convert between PDF and CBZ comic formats")
-    parser.add_argument("filePath", help="Path to a PDF/CBZ file or directory containing PDF/CBZ files")
-    parser.add_argument("-o", "--output-dir", default=".", help="Output directory for images")
-    parser.add_argument("-t", "--output-type", default="cbz", help="Output type: cbz (default) or pdf")
+    parser.add_argument("filePath", help="Path to a PDF/CBZ/CBR/CB7/CBT file, an image folder, "
+                                         "or a directory containing them; - reads one book from stdin")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="Output directory for images; - writes the output to stdout")
+    parser.add_argument("-t", "--output-type", default="cbz",
+                        help="Output type: cbz (default), pdf, epub or images; "
+                             "comma-separate several (e.g. cbz,pdf) to write them all from one extraction pass")
+    parser.add_argument("-p", "--profile", dest="profiles", action="append", default=[], metavar="SPEC",
+                        help="Output profile TYPE[:OPTION=VALUE,...] (repeatable, overrides -t). Options: suffix, "
+                             "max_width, max_height, quality, grayscale. "
+                             "Example: -p cbz -p cbz:suffix=_phone,max_height=1600,quality=80 -p pdf")
+    parser.add_argument("--dedupe", choices=["flag", "remove"],
+                        help="Detect near-duplicate pages with perceptual hashing: flag them or remove them")
+    parser.add_argument("--dedupe-scope", choices=["book", "library"], default="book",
+                        help="Match duplicates within each book (default) or across all input files")
+    parser.add_argument("--dedupe-threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help=f"Maximum hash distance (out of 64 bits) for a duplicate (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--dedupe-method", choices=list(HASH_METHODS), default="dhash",
+                        help="Perceptual hash to use (default: dhash)")
+    parser.add_argument("--dedupe-report", metavar="PATH", help="Write the duplicate report as JSON")
+    parser.add_argument("--find-duplicates", action="store_true",
+                        help="Only report duplicate pages, without converting")
+    parser.add_argument("--thumbnails", metavar="INDEX_DIR",
+                        help="Only generate cover thumbnails into a persistent index keyed on file hash "
+                             "(unchanged books are skipped)")
+    parser.add_argument("--thumbnail-sizes", default="300", metavar="SIZES",
+                        help="Thumbnail sizes (longest side in pixels), e.g. 150,300 (default: 300)")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of files to convert (default: 1) or verify (default: CPU count) in parallel; "
+                             "conversions start largest first")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="Only start another file while the predicted memory of running files fits in MB")
+    parser.add_argument("--cost-model", metavar="PATH",
+                        help="Cost model JSON used to predict file times (e.g. a previous --schedule-report)")
+    parser.add_argument("--schedule-report", metavar="PATH",
+                        help="Write predicted vs. actual times per file, with a refitted cost model, as JSON")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Only convert shard I of N of the scanned files (stable hash partition, so "
+                             "hosts sharing a library can each take a shard without coordinating)")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="Write this run's result manifest (default with --shard: "
+                             "OUTPUT_DIR/shard-I-of-N.manifest.json)")
+    parser.add_argument("--merge-manifests", metavar="REPORT",
+                        help="Merge the shard manifests at filePath (a manifest or a directory of them) "
+                             "into one JSON report, without converting")
+    parser.add_argument("--plan", action="store_true",
+                        help="Only estimate the run from container metadata (no pixels decoded): pages, image "
+                             "formats, output size, time, and files likely to fail")
+    parser.add_argument("--plan-report", metavar="PATH", help="Write the --plan estimate as JSON")
+    parser.add_argument("--verify", action="store_true",
+                        help="Only verify the outputs at filePath (a file or a directory of outputs): zip CRCs, "
+                             "image headers, PDF xref table and page counts")
+    parser.add_argument("--verify-source", metavar="PATH",
+                        help="Source file or directory to compare page counts against with --verify")
+    parser.add_argument("--verify-output", action="store_true",
+                        help="Verify every output right after it is written")
+    parser.add_argument("--metadata-only", action="store_true",
+                        help="Rewrite ComicInfo.xml inside CBZ files in place without converting images")
+    parser.add_argument("--set", dest="metadata", action="append", default=[], metavar="FIELD=VALUE",
+                        help="ComicInfo field to set with --metadata-only (repeatable, empty value removes the field)")
     
     args = parser.parse_args()
     input_path = args.filePath
     
+    if args.metadata_only:
+        run_metadata_update(input_path, args.metadata)
+        return
+    
+    if args.merge_manifests:
+        run_manifest_merge(input_path, args.merge_manifests)
+        return
+    
+    if args.verify:
+        run_verification(input_path, args.verify_source, args.jobs)
+        return
+    
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"[!] Error: {e}")
+            return
+    
+    output_type = args.output_type
+    try:
+        if args.profiles:
+            output_type = [parse_profile(spec) for spec in args.profiles]
+        parse_profiles(output_type)
+    except ValueError as e:
+        print(f"[!] Error: {e}", file=sys.stderr if args.output_dir == "-" else sys.stdout)
+        return
+    
+    if input_path == "-" or args.output_dir == "-":
+        run_stream_conversion(input_path, args.output_dir, output_type, args.dedupe)
+        return
+    
+    files_to_process = collect_input_files(input_path)
+    if not files_to_process:
+        return
+    scanned = len(files_to_process)
+    if shard is not None:
+        files_to_process = select_shard(files_to_process, input_path, *shard)
+        print(f"[+] Shard {shard[0]}/{shard[1]}: {len(files_to_process)} of {scanned} files")
+    
+    cost_model = None
+    if args.cost_model:
+        try:
+            cost_model = CostModel.load(args.cost_model)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[!] Error: Could not load cost model {args.cost_model}: {e}")
+            return
+    
+    if args.plan:
+        run_plan(files_to_process, parse_profiles(output_type), args.output_dir, cost_model,
+                 args.jobs or 1, args.plan_report)
+        return
+    
+    if args.thumbnails:
+        try:
+            sizes = parse_sizes(args.thumbnail_sizes)
+        except ValueError as e:
+            print(f"[!] Error: {e}")
+            return
+        counts = update_thumbnail_index(files_to_process, args.thumbnails, sizes,
+                                        lambda message: print(f"[+] {message}"))
+        print(f"\n[+] === Thumbnails Complete ===")
+        print(f"[+] Generated: {counts['generated']}")
+        print(f"[+] Unchanged: {counts['unchanged']}")
+        if counts['failed'] > 0:
+            print(f"[!] Failed: {counts['failed']}")
+        return
+    
+    duplicate_index = None
+    if args.dedupe or args.find_duplicates:
+        if not dedupe_available():
+            print("[!] Error: Duplicate detection requires numpy (install the 'analysis' extra)")
+            return
+        duplicate_index = DuplicateIndex(library_wide=args.dedupe_scope == "library",
+                                         threshold=args.dedupe_threshold, method=args.dedupe_method)
+    
+    if args.find_duplicates:
+        report = scan_library(files_to_process, duplicate_index, lambda message: print(f"[!] {message}"))
+        print_duplicate_report(report, args.dedupe_report)
+        if args.dedupe_report:
+            duplicate_index.write_report(args.dedupe_report)
+        return
+
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    
+    # Process all files, largest first
+    progress = convert_multiple_files(files_to_process, args.output_dir, output_type,
+                                      lambda progress: print(f"[+] {progress.current_operation}"),
+                                      dedupe=args.dedupe, duplicate_index=duplicate_index,
+                                      jobs=args.jobs or 1, memory_budget=memory_budget, cost_model=cost_model,
+                                      verify=args.verify_output)
+    for error in progress.errors:
+        print(f"[!] {error}")
+    
+    # Summary
+    schedule = progress.schedule
+    print(f"\n[+] === Batch Processing Complete ===")
+    print(f"[+] Total files processed: {len(files_to_process)}")
+    print(f"[+] Successful conversions: {progress.success_count}")
+    if progress.error_count > 0:
+        print(f"[!] Failed conversions: {progress.error_count}")
+    print(f"[+] Time: {schedule['wall_seconds']:.1f}s elapsed, "
+          f"{schedule['actual_seconds']:.1f}s of conversions (predicted {schedule['predicted_seconds']:.1f}s)")
+    if args.schedule_report:
+        write_schedule_report(schedule, args.schedule_report)
+        print(f"[+] Schedule report written to: {args.schedule_report}")
+    manifest_path = args.manifest or (manifest_path_for(args.output_dir, *shard) if shard else None)
+    if manifest_path:
+        index, count = shard or (1, 1)
+        write_manifest(build_manifest(index, count, input_path, schedule, scanned), manifest_path)
+        print(f"[+] Manifest written to: {manifest_path}")
+    
+    if duplicate_index is not None:
+        print_duplicate_report(duplicate_index.report(), args.dedupe_report)
+        if args.dedupe_report:
+            duplicate_index.write_report(args.dedupe_report)
+
+
+def run_stream_conversion(input_path: str, output_dir: str, output_type, dedupe: str = None):
+    """
+    Convert one book with stdin as input and/or stdout as output ('-')
+
+    Messages go to stderr, so stdout carries nothing but the output.
+    """
+    def log(message: str):
+        print(message, file=sys.stderr)
+    
+    if input_path != "-" and not os.path.exists(input_path):
+        log(f"[!] Error: Path does not exist: {input_path}")
+        return
+    if output_dir == "-" and len(parse_profiles(output_type)) != 1:
+        log("[!] Error: Only one output type or profile can be written to stdout")
+        return
+    if output_dir == "-" and sys.stdout.isatty():
+        log("[!] Error: Refusing to write binary output to a terminal; redirect or pipe stdout")
+        return
+    source = sys.stdin.buffer if input_path == "-" else input_path
+    output = sys.stdout.buffer if output_dir == "-" else output_dir
+    
+    success = convert_single_file(source, output, output_type,
+                                  lambda progress: log(f"[+] {progress.current_operation}"), dedupe=dedupe)
+    if output_dir == "-":
+        sys.stdout.buffer.flush()
+    if not success:
+        log("[!] Conversion failed")
+        sys.exit(1)
+
+
+def collect_input_files(input_path: str) -> list:
+    """Resolve the input argument to a list of books, printing why if there are none"""
     # Check if input is a directory or file
     if os.path.isdir(input_path):
         # Process directory - find all supported files
         files_to_process = get_supported_files(input_path)
         
+        if not files_to_process and is_image_folder(input_path):
+            # The directory itself is a book made of page images
+            files_to_process = [input_path]
+        
         if not files_to_process:
             print(f"[!] No supported files found in directory: {input_path}")
-            print(f"[!] Supported formats: PDF, CBZ")
-            return
+            print(f"[!] Supported formats: {', '.join(ext.lstrip('.').upper() for ext in supported_extensions())}, image folders")
+            return []
         print(f"[+] Found {len(files_to_process)} supported files to process")
+        return files_to_process
         
     elif os.path.isfile(input_path):
         # Single file processing
         file_extension = os.path.splitext(input_path)[1].lower()
-        if file_extension not in ['.pdf', '.cbz']:
-            print(f"[!] Error: Unsupported file format '{file_extension}'. Only PDF and CBZ files are supported.")
-            return
-        files_to_process = [input_path]
+        if file_extension not in supported_extensions():
+            print(f"[!] Error: Unsupported file format '{file_extension}'. Supported formats: "
+                  f"{', '.join(ext.lstrip('.').upper() for ext in supported_extensions())}")
+            return []
+        return [input_path]
         
+    print(f"[!] Error: Path does not exist: {input_path}")
+    return []
+
+
+def print_duplicate_report(report: dict, report_path: str = None):
+    """Print a summary of duplicate pages found"""
+    scope = "library" if report['library_wide'] else "book"
+    print(f"\n[+] === Duplicate Pages ({report['method']}, {scope} scope) ===")
+    print(f"[+] Duplicate pages found: {report['duplicate_count']}")
+    for book, duplicates in report['books'].items():
+        print(f"[+] {book}: {len(duplicates)} duplicate pages")
+        for duplicate in duplicates:
+            print(f"      page {duplicate['page']} ~ {duplicate['duplicate_of_book']} "
+                  f"page {duplicate['duplicate_of_page']} (distance {duplicate['distance']})")
+    if report_path:
+        print(f"[+] Report written to: {report_path}")
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def run_plan(files: list, profiles: list, output_dir: str, cost_model: CostModel = None, jobs: int = 1,
+             report_path: str = None):
+    """Print a dry-run estimate of a batch conversion"""
+    def report_file(plan):
+        name = os.path.basename(os.path.normpath(plan.path))
+        if not plan.supported:
+            print(f"[!] {name}: {'; '.join(plan.problems)}")
+            return
+        formats = ", ".join(f"{count} {image_format}" for image_format, count in plan.image_formats.most_common())
+        print(f"[+] {name}: {plan.format_name}, {plan.pages} pages ({formats}), "
+              f"~{_format_size(sum(plan.estimated_output.values()))} out, ~{plan.estimated_seconds:.1f}s")
+        for warning in plan.warnings:
+            print(f"      {warning}")
+    
+    report = plan_report(plan_files(files, profiles, cost_model, report_file), cost_model, jobs)
+    
+    print(f"\n[+] === Plan ({', '.join(profile.name for profile in profiles)}) ===")
+    print(f"[+] Files: {report['supported']} of {report['files']} convertible, {report['pages']} pages, "
+          f"{_format_size(report['input_bytes'])} in")
+    for name, size in report['estimated_output_by_profile'].items():
+        print(f"[+] Estimated {name} output: {_format_size(size)}")
+    print(f"[+] Estimated time: {report['estimated_wall_seconds']:.1f}s with {jobs} job(s) "
+          f"({report['estimated_seconds']:.1f}s of conversions)")
+    if os.path.isdir(output_dir):
+        free = shutil.disk_usage(output_dir).free
+        report['output_free_bytes'] = free
+        if report['estimated_output_bytes'] > free:
+            print(f"[!] Output directory has only {_format_size(free)} free")
+    for entry in report['unsupported']:
+        print(f"[!] Likely to fail: {os.path.basename(os.path.normpath(entry['path']))} "
+              f"({'; '.join(entry['problems'])})")
+    if report_path:
+        write_plan_report(report, report_path)
+        print(f"[+] Plan written to: {report_path}")
+
+
+def run_verification(output_path: str, source_path: str = None, jobs: int = None):
+    """Verify outputs in parallel, comparing page counts with their sources when given"""
+    if os.path.isdir(output_path):
+        outputs = find_outputs(output_path)
+    elif os.path.isfile(output_path):
+        outputs = [output_path]
     else:
-        print(f"[!] Error: Path does not exist: {input_path}")
+        print(f"[!] Error: Path does not exist: {output_path}")
         return
+    if not outputs:
+        print(f"[!] No outputs to verify in: {output_path}")
+        return
+    
+    expected_pages = {}
+    if source_path:
+        sources = get_supported_files(source_path) if os.path.isdir(source_path) else [source_path]
+        expected_pages = expected_page_counts(outputs, sources)
+        print(f"[+] Matched {len(expected_pages)} of {len(outputs)} outputs to sources")
+    
+    def report(result):
+        if result.ok:
+            print(f"[+] OK: {os.path.basename(result.path)} ({result.format_name}, {result.pages} pages)")
+        else:
+            print(f"[!] FAILED: {os.path.basename(result.path)} ({result.format_name})")
+            for problem in result.problems:
+                print(f"      {problem}")
+    
+    results = verify_outputs(outputs, expected_pages, jobs, report)
+    failed = sum(1 for result in results if not result.ok)
+    print(f"\n[+] === Verification Complete ===")
+    print(f"[+] Verified: {len(results) - failed}/{len(results)}")
+    if failed:
+        print(f"[!] Failed: {failed}")
+
 
-    # Process all files
-    total_files = len(files_to_process)
-    successful_conversions = 0
-    failed_conversions = 0
+def run_manifest_merge(manifest_path: str, report_path: str):
+    """Combine shard manifests into one report and print its summary"""
+    try:
+        report = merge_manifests(load_manifests(manifest_path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[!] Error: Could not merge manifests from {manifest_path}: {e}")
+        return
+    write_merged_report(report, report_path)
     
-    for i, file_path in enumerate(files_to_process, 1):
-        print(f"\n[+] === Processing file {i}/{total_files} ===")
+    print(f"[+] === Shard Report ({len(report['shards'])}/{report['shard_count']} shards) ===")
+    for shard, summary in report['shards'].items():
+        print(f"[+] Shard {shard} on {summary['host']}: {summary['files']} files in {summary['wall_seconds']:.1f}s")
+    print(f"[+] Converted: {report['converted']} of {report['scanned']} files, {report['successful']} successful")
+    print(f"[+] Time: {report['wall_seconds']:.1f}s elapsed, {report['actual_seconds']:.1f}s of conversions "
+          f"(predicted {report['predicted_seconds']:.1f}s)")
+    if report['missing_shards']:
+        print(f"[!] Missing shards: {', '.join(str(shard) for shard in report['missing_shards'])}")
+    for key in report['failed']:
+        print(f"[!] Failed: {key}")
+    for key in report['duplicate_files']:
+        print(f"[!] Converted by several shards: {key}")
+    print(f"[+] Report written to: {report_path}")
+
+
+def run_metadata_update(input_path: str, assignments: list):
+    """Apply FIELD=VALUE ComicInfo updates to a CBZ file or every CBZ in a directory"""
+    updates = {}
+    for assignment in assignments:
+        if "=" not in assignment:
+            print(f"[!] Error: Invalid metadata assignment '{assignment}'. Use FIELD=VALUE.")
+            return
+        field, value = assignment.split("=", 1)
         try:
-            success = convert_single_file(file_path, args.output_dir, args.output_type)
-            if success:
-                successful_conversions += 1
-            else:
-                failed_conversions += 1
-        except Exception as e:
-            print(f"[!] Error processing {file_path}: {str(e)}")
-            failed_conversions += 1
+            check_field_name(field.strip())
+        except ValueError as e:
+            print(f"[!] Error: {str(e)}")
+            return
+        updates[field.strip()] = value
     
-    # Summary
-    print(f"\n[+] === Batch Processing Complete ===")
-    print(f"[+] Total files processed: {total_files}")
-    print(f"[+] Successful conversions: {successful_conversions}")
-    if failed_conversions > 0:
-        print(f"[!] Failed conversions: {failed_conversions}")
+    if not updates:
+        print("[!] Error: --metadata-only requires at least one --set FIELD=VALUE")
+        return
+    
+    if os.path.isdir(input_path):
+        files_to_process = [f for f in get_supported_files(input_path) if f.lower().endswith('.cbz')]
+    elif os.path.isfile(input_path) and input_path.lower().endswith('.cbz'):
+        files_to_process = [input_path]
+    else:
+        print(f"[!] Error: Metadata updates require a CBZ file or a directory of CBZ files: {input_path}")
+        return
+    
+    updated = 0
+    for file_path in files_to_process:
+        if update_cbz_metadata(file_path, updates, update_progress=lambda message: print(f"[+] {message}")):
+            updated += 1
+    
+    print(f"\n[+] Metadata updated in {updated}/{len(files_to_process)} files")
 
 
 if __name__ == "__main__":
+    # --verify runs worker processes; frozen (PyInstaller) builds start them
+    # by re-running this executable, which must hand off to the worker here
+    multiprocessing.freeze_support()
     main()
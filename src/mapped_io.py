@@ -0,0 +1,129 @@
+import io
+import mmap
+import struct
+import tarfile
+import zipfile
+from typing import Optional, Union
+
+
+# Read sources through memory maps; set to False to use plain buffered file reads
+USE_MMAP = True
+
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+def map_file(path: str) -> Optional[mmap.mmap]:
+    """
+    Memory-map a file read-only
+
+    Returns:
+        The mapping, or None if mapping is disabled or not possible (e.g. an empty file)
+    """
+    if not USE_MMAP:
+        return None
+    try:
+        with open(path, 'rb') as source:
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+def close_map(mapping: Optional[mmap.mmap]):
+    """Unmap a file, unless pages still reference it (it is then unmapped when they are released)"""
+    if mapping is None:
+        return
+    try:
+        mapping.close()
+    except BufferError:
+        pass
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only file object over a buffer (e.g. a memoryview of a mapped file)
+
+    io.BytesIO copies anything that isn't a bytes object; this reads
+    straight from the buffer, copying only what the caller asks for. Unlike
+    an mmap object, it also accepts seeks past either end as files do, so
+    archive modules report a damaged archive rather than a bad seek.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._position + size)
+        data = bytes(self._view[self._position:end])
+        self._position = max(self._position, end)
+        return data
+
+    def readinto(self, target) -> int:
+        count = min(len(target), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        target[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+def open_buffer(data: Union[bytes, memoryview]) -> io.RawIOBase:
+    """File object over page bytes for Pillow, without copying memoryviews"""
+    if isinstance(data, bytes):
+        # BytesIO shares a bytes object's memory until it is written to
+        return io.BytesIO(data)
+    return BufferReader(data)
+
+
+def stored_zip_member(mapping: mmap.mmap, info: zipfile.ZipInfo) -> Optional[memoryview]:
+    """
+    Slice an uncompressed zip member straight out of a mapped archive
+
+    The data is not copied, and so its CRC is not checked (verify.py reads
+    members through zipfile for that). Compressed or encrypted members
+    return None and must be read through zipfile.
+    """
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return None
+    start = info.header_offset
+    if start + _LOCAL_HEADER.size > len(mapping):
+        return None
+    header = _LOCAL_HEADER.unpack_from(mapping, start)
+    if header[0] != _LOCAL_HEADER_SIGNATURE:
+        return None
+    # The local header's name and extra field lengths can differ from the central directory's
+    name_length, extra_length = header[-2], header[-1]
+    data_start = start + _LOCAL_HEADER.size + name_length + extra_length
+    if data_start + info.compress_size > len(mapping):
+        return None
+    return memoryview(mapping)[data_start:data_start + info.compress_size]
+
+
+def tar_member(mapping: mmap.mmap, member: tarfile.TarInfo) -> Optional[memoryview]:
+    """Slice a member straight out of a mapped uncompressed tar archive (None for sparse members)"""
+    if member.issparse() or member.offset_data + member.size > len(mapping):
+        return None
+    return memoryview(mapping)[member.offset_data:member.offset_data + member.size]
@@ -0,0 +1,432 @@
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+COMICINFO_NAME = "ComicInfo.xml"
+
+# ComicInfo.xml fields that are written back as plain text elements
+COMICINFO_FIELDS = [
+    'Title', 'Series', 'Number', 'Count', 'Volume', 'Summary', 'Notes',
+    'Year', 'Month', 'Day', 'Writer', 'Penciller', 'Inker', 'Colorist',
+    'Letterer', 'CoverArtist', 'Editor', 'Publisher', 'Imprint', 'Genre',
+    'Tags', 'Web', 'PageCount', 'LanguageISO', 'Format', 'Manga',
+]
+
+# Plain element name: no paths, namespaces or XPath syntax
+_FIELD_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_-]*\Z')
+
+# PDF document metadata key -> ComicInfo field
+PDF_TO_COMICINFO = {
+    'title': 'Title',
+    'author': 'Writer',
+    'subject': 'Summary',
+    'keywords': 'Tags',
+    'creator': 'Notes',
+}
+
+
+def parse_comicinfo(data: bytes) -> Dict:
+    """
+    Parse ComicInfo.xml content into a dictionary
+
+    Args:
+        data: Raw ComicInfo.xml bytes
+
+    Returns:
+        Dictionary of text fields plus a 'Pages' list of page attribute dicts
+    """
+    info = {}
+    root = ET.fromstring(data)
+    for child in root:
+        if child.tag == 'Pages':
+            info['Pages'] = [dict(page.attrib) for page in child if page.tag == 'Page']
+        elif child.text is not None and child.text.strip():
+            info[child.tag] = child.text.strip()
+    return info
+
+
+def check_field_name(field: str):
+    """
+    Check that a field can be set as a ComicInfo text element
+
+    Raises:
+        ValueError: If the name is not a plain element name, or is 'Pages'
+            (a list of page entries rather than a text field)
+    """
+    if not _FIELD_NAME.match(field):
+        raise ValueError(f"Invalid ComicInfo field name '{field}'")
+    if field == 'Pages':
+        raise ValueError("Pages is a list of page entries and can't be set as a field")
+
+
+def build_comicinfo(info: Dict) -> bytes:
+    """Serialize a metadata dictionary to ComicInfo.xml bytes"""
+    return update_comicinfo(None, info)
+
+
+def update_comicinfo(data: Optional[bytes], updates: Dict) -> bytes:
+    """
+    Apply field updates to existing ComicInfo.xml content
+
+    Unknown elements in the original document are kept as-is. A field set to
+    an empty string or None is removed. A 'Pages' entry replaces the page list.
+
+    Args:
+        data: Existing ComicInfo.xml bytes, or None to start from scratch
+        updates: Mapping of field name to new value
+
+    Returns:
+        Updated ComicInfo.xml bytes
+    """
+    if data:
+        root = ET.fromstring(data)
+    else:
+        root = ET.Element('ComicInfo', {
+            'xmlns:xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+            'xmlns:xsd': 'http://www.w3.org/2001/XMLSchema',
+        })
+
+    for field, value in updates.items():
+        element = root.find(field)
+
+        if field == 'Pages':
+            if element is not None:
+                root.remove(element)
+            if value:
+                pages_element = ET.SubElement(root, 'Pages')
+                for page in value:
+                    ET.SubElement(pages_element, 'Page', {k: str(v) for k, v in page.items()})
+            continue
+
+        if value is None or str(value) == "":
+            if element is not None:
+                root.remove(element)
+            continue
+
+        if element is None:
+            element = ET.SubElement(root, field)
+        element.text = str(value)
+
+    ET.indent(root)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+
+def remap_pages(pages: List[Dict], page_map: Dict[int, int]) -> List[Dict]:
+    """
+    Renumber ComicInfo page entries for an output whose pages differ from the source's
+
+    Args:
+        pages: 'Pages' entries as returned by parse_comicinfo, indexed by source page
+        page_map: Mapping of source page index to output page index (a split
+            spread maps to its first half); entries of pages missing from it are dropped
+
+    Returns:
+        Page entries indexed by output page
+    """
+    remapped = []
+    for page in pages:
+        try:
+            image_index = page_map.get(int(page.get('Image', "")))
+        except ValueError:
+            continue
+        if image_index is not None:
+            remapped.append(dict(page, Image=str(image_index)))
+    return remapped
+
+
+def _parse_pdf_date(value: str) -> Dict[str, str]:
+    """Extract Year/Month/Day from a PDF date string (D:YYYYMMDD...)"""
+    match = re.match(r"(?:D:)?(\d{4})(\d{2})?(\d{2})?", value or "")
+    if not match:
+        return {}
+    fields = {'Year': str(int(match.group(1)))}
+    if match.group(2):
+        fields['Month'] = str(int(match.group(2)))
+    if match.group(3):
+        fields['Day'] = str(int(match.group(3)))
+    return fields
+
+
+def pdf_to_comicinfo(pdf_metadata: Optional[Dict], toc: List, page_to_image: Dict[int, int]) -> Dict:
+    """
+    Map PDF document metadata and outline to ComicInfo fields
+
+    Args:
+        pdf_metadata: Document metadata as returned by fitz Document.metadata
+        toc: Outline as returned by fitz Document.get_toc() ([level, title, page], 1-based pages)
+        page_to_image: Mapping of 0-based PDF page index to first extracted image index
+
+    Returns:
+        ComicInfo metadata dictionary (empty if the PDF carries nothing useful)
+    """
+    info = {}
+    pdf_metadata = pdf_metadata or {}
+
+    for pdf_key, field in PDF_TO_COMICINFO.items():
+        value = (pdf_metadata.get(pdf_key) or "").strip()
+        if value:
+            info[field] = value
+
+    info.update(_parse_pdf_date(pdf_metadata.get('creationDate', "")))
+
+    pages = {}
+    for level, title, page_number in toc or []:
+        image_index = page_to_image.get(page_number - 1)
+        if image_index is None or image_index in pages:
+            continue
+        pages[image_index] = {'Image': str(image_index), 'Bookmark': title}
+
+    if pages:
+        info['Pages'] = [pages[index] for index in sorted(pages)]
+
+    return info
+
+
+def comicinfo_to_pdf(info: Dict) -> Tuple[Dict[str, str], List]:
+    """
+    Map ComicInfo fields to PDF document metadata and outline
+
+    Args:
+        info: ComicInfo metadata dictionary
+
+    Returns:
+        Tuple of (metadata dict for Document.set_metadata, toc list for Document.set_toc)
+    """
+    metadata = {}
+    for pdf_key, field in PDF_TO_COMICINFO.items():
+        if info.get(field):
+            metadata[pdf_key] = info[field]
+
+    if 'title' not in metadata and info.get('Series'):
+        title = info['Series']
+        if info.get('Number'):
+            title = f"{title} #{info['Number']}"
+        metadata['title'] = title
+
+    if info.get('Year'):
+        try:
+            metadata['creationDate'] = "D:{:04d}{:02d}{:02d}000000".format(
+                int(info['Year']), int(info.get('Month') or 1), int(info.get('Day') or 1))
+        except ValueError:
+            pass
+
+    toc = []
+    for page in info.get('Pages', []):
+        bookmark = page.get('Bookmark')
+        if not bookmark:
+            continue
+        try:
+            image_index = int(page.get('Image', ""))
+        except ValueError:
+            continue
+        toc.append([1, bookmark, image_index + 1])
+    toc.sort(key=lambda entry: entry[2])
+
+    return metadata, toc
+
+
+def find_comicinfo(zip_file: zipfile.ZipFile) -> Optional[zipfile.ZipInfo]:
+    """Find the ComicInfo.xml member of an archive, preferring the archive root"""
+    candidates = [info for info in zip_file.infolist()
+                  if os.path.basename(info.filename).lower() == COMICINFO_NAME.lower()]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda info: info.filename.count('/'))
+
+
+# Zip records (APPNOTE.TXT 4.3), used to retag archives in place
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_RECORD = struct.Struct('<4s6H3L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_CENTRAL_RECORD_SIGNATURE = b'PK\x01\x02'
+_END_RECORD_SIGNATURE = b'PK\x05\x06'
+_ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+# Field values that mean the real value is in a zip64 record
+_ZIP64_MARKERS = (0xFFFF, 0xFFFFFFFF)
+
+
+def _read_central_directory(archive_file) -> Optional[Tuple[List[Tuple[int, bytes]], int, bytes]]:
+    """
+    Read a zip's central directory as raw records
+
+    Returns:
+        (header offset, raw central record) per member, the directory's offset
+        and the archive comment; None for archives that can't be patched in
+        place (zip64, split, or data between the directory and its end record)
+    """
+    archive_file.seek(0, os.SEEK_END)
+    file_size = archive_file.tell()
+    tail_start = max(0, file_size - _END_RECORD.size - 0xFFFF)
+    archive_file.seek(tail_start)
+    tail = archive_file.read()
+    position = tail.rfind(_END_RECORD_SIGNATURE)
+    if position < 0 or len(tail) - position < _END_RECORD.size:
+        return None
+    (_, disk, directory_disk, disk_entries, entries,
+     directory_size, directory_offset, comment_length) = _END_RECORD.unpack_from(tail, position)
+    if (disk or directory_disk or disk_entries != entries
+            or entries in _ZIP64_MARKERS or directory_size in _ZIP64_MARKERS or directory_offset in _ZIP64_MARKERS
+            or tail[max(0, position - 20):position - 16] == _ZIP64_LOCATOR_SIGNATURE
+            or directory_offset + directory_size != tail_start + position):
+        return None
+    comment = tail[position + _END_RECORD.size:position + _END_RECORD.size + comment_length]
+
+    archive_file.seek(directory_offset)
+    directory = archive_file.read(directory_size)
+    records = []
+    offset = 0
+    while offset < len(directory):
+        if len(directory) - offset < _CENTRAL_RECORD.size:
+            return None
+        fields = _CENTRAL_RECORD.unpack_from(directory, offset)
+        if fields[0] != _CENTRAL_RECORD_SIGNATURE or fields[-1] in _ZIP64_MARKERS:
+            return None
+        length = _CENTRAL_RECORD.size + fields[10] + fields[11] + fields[12]
+        records.append((fields[-1], directory[offset:offset + length]))
+        offset += length
+    if len(records) != entries:
+        return None
+    return records, directory_offset, comment
+
+
+def _comicinfo_records(data: bytes, offset: int) -> Tuple[bytes, bytes]:
+    """Local header plus deflated data, and the central record, of a new root ComicInfo.xml"""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    now = time.localtime()
+    dos_time = now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+    dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+    name = COMICINFO_NAME.encode('ascii')
+    crc = zlib.crc32(data)
+    local = _LOCAL_HEADER.pack(_LOCAL_HEADER_SIGNATURE, 20, 0, zipfile.ZIP_DEFLATED, dos_time, dos_date,
+                               crc, len(compressed), len(data), len(name), 0) + name + compressed
+    central = _CENTRAL_RECORD.pack(_CENTRAL_RECORD_SIGNATURE, 3 << 8 | 20, 20, 0, zipfile.ZIP_DEFLATED,
+                                   dos_time, dos_date, crc, len(compressed), len(data), len(name), 0, 0, 0, 0,
+                                   0o100644 << 16, offset) + name
+    return local, central
+
+
+def _retag_in_place(file_path: str, existing_offset: Optional[int], comicinfo_data: bytes) -> bool:
+    """
+    Replace or add ComicInfo.xml by rewriting only the end of the archive
+
+    Possible when ComicInfo.xml is missing (it is appended where the central
+    directory starts) or is the last member (it is overwritten). Every other
+    member stays where it is, so the cost is that of the central directory.
+
+    Returns:
+        False, with the file untouched, if the archive's layout doesn't allow it
+    """
+    with open(file_path, 'r+b') as archive_file:
+        directory = _read_central_directory(archive_file)
+        if directory is None:
+            return False
+        records, directory_offset, comment = directory
+        kept = [record for offset, record in records if offset != existing_offset]
+        if existing_offset is None:
+            write_offset = directory_offset
+        elif any(offset > existing_offset for offset, _ in records):
+            return False
+        else:
+            write_offset = existing_offset
+
+        local, central = _comicinfo_records(comicinfo_data, write_offset)
+        directory = b''.join(kept) + central
+        if write_offset + len(local) + len(directory) >= 0xFFFFFFFF or len(kept) + 1 >= 0xFFFF:
+            return False
+        end = _END_RECORD.pack(_END_RECORD_SIGNATURE, 0, 0, len(kept) + 1, len(kept) + 1, len(directory),
+                               write_offset + len(local), len(comment)) + comment
+        archive_file.seek(write_offset)
+        archive_file.write(local + directory + end)
+        archive_file.truncate()
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+    return True
+
+
+def _rewrite_archive(file_path: str, target_path: str, existing_offset: Optional[int], comicinfo_data: bytes):
+    """Copy every member but the old ComicInfo.xml into a new archive, then add the new one"""
+    with zipfile.ZipFile(file_path, 'r') as source, zipfile.ZipFile(target_path, 'w') as target:
+        target.comment = source.comment
+        for info in source.infolist():
+            if info.header_offset == existing_offset:
+                continue
+            if info.flag_bits & 0x1:
+                raise zipfile.BadZipFile(f"Encrypted member not supported: {info.filename}")
+            copy = zipfile.ZipInfo(info.filename, info.date_time)
+            copy.compress_type = info.compress_type
+            copy.external_attr = info.external_attr
+            copy.create_system = info.create_system
+            copy.comment = info.comment
+            if info.is_dir():
+                target.writestr(copy, b'')
+                continue
+            zip64 = info.file_size > zipfile.ZIP64_LIMIT
+            with source.open(info) as member, target.open(copy, 'w', force_zip64=zip64) as output:
+                shutil.copyfileobj(member, output, 1024 * 1024)
+        target.writestr(COMICINFO_NAME, comicinfo_data, zipfile.ZIP_DEFLATED)
+
+
+def update_cbz_metadata(file_path: str, updates: Dict, output_path: Optional[str] = None,
+                        update_progress: Optional[Callable[[str], None]] = None) -> bool:
+    """
+    Rewrite ComicInfo.xml inside a CBZ without touching any image data
+
+    In place, when ComicInfo.xml is missing or is the last member (as this
+    tool writes it), only the end of the file is rewritten: the new
+    ComicInfo.xml and the central directory. The cost is that of the zip
+    directory, whatever the archive's size. Otherwise (or with output_path,
+    or for zip64 archives) every member is copied into a new archive, which
+    replaces the original atomically. The progress message says which ran.
+
+    Args:
+        file_path: Path to the CBZ file
+        updates: Mapping of ComicInfo field name to new value ('' removes a field)
+        output_path: Where to write the result (defaults to rewriting file_path in place)
+        update_progress: Optional callback for progress messages
+
+    Returns:
+        True if successful, False otherwise
+    """
+    def report(message: str):
+        if update_progress:
+            update_progress(message)
+
+    target_path = output_path or file_path
+    temp_path = None
+
+    try:
+        with zipfile.ZipFile(file_path, 'r') as source:
+            existing = find_comicinfo(source)
+            existing_data = source.read(existing) if existing else None
+        existing_offset = existing.header_offset if existing else None
+        comicinfo_data = update_comicinfo(existing_data, updates)
+
+        in_place = os.path.abspath(target_path) == os.path.abspath(file_path)
+        if in_place and _retag_in_place(file_path, existing_offset, comicinfo_data):
+            report(f"Metadata updated in place: {target_path}")
+            return True
+
+        fd, temp_path = tempfile.mkstemp(suffix='.cbz', dir=os.path.dirname(os.path.abspath(target_path)))
+        os.close(fd)
+        _rewrite_archive(file_path, temp_path, existing_offset, comicinfo_data)
+        # mkstemp creates the file private (0600); keep the original's permissions
+        shutil.copymode(file_path, temp_path)
+        shutil.move(temp_path, target_path)
+        report(f"Metadata updated (archive rewritten): {target_path}")
+        return True
+
+    except Exception as e:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        report(f"Error updating metadata: {str(e)}")
+        return False
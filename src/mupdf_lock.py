@@ -0,0 +1,11 @@
+import threading
+
+
+# PyMuPDF is not thread-safe: MuPDF keeps global state that two threads can
+# corrupt even when they work on different documents. Batch jobs and profile
+# workers run on threads, so every fitz call (opening, reading, building,
+# saving and closing documents) is made while holding this lock. Pillow
+# decoding and encoding, zip and tar work all stay outside it, so only PDF
+# work is serialized; code that needs PDF work in parallel uses processes
+# (see verify.verify_outputs).
+MUPDF_LOCK = threading.RLock()
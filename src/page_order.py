@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+# Metadata that archivers and operating systems leave behind inside comic archives
+IGNORED_NAMES = {'thumbs.db', 'desktop.ini', '.ds_store'}
+
+_DIGITS = re.compile(r'(\d+)')
+
+# Page indexes by (path, size, mtime_ns), least recently used first
+_PAGE_INDEX_CACHE: 'OrderedDict[Tuple[str, int, int], Tuple[str, ...]]' = OrderedDict()
+_PAGE_INDEX_CACHE_SIZE = 256
+_page_index_lock = threading.Lock()
+
+
+def natural_sort_key(text: str) -> List:
+    """Sort key that orders embedded numbers numerically (page2 before page10)"""
+    # split() puts the matched numbers at odd positions; str.isdigit() would
+    # also accept characters like '²' that int() rejects
+    return [int(part) if position % 2 else part.lower() for position, part in enumerate(_DIGITS.split(text))]
+
+
+def page_sort_key(member_name: str) -> Tuple:
+    """
+    Sort key for an archive member path
+
+    Pages are grouped by folder (folders compared part by part with natural
+    sort), so chapter folders never interleave and loose root pages come first.
+    """
+    parts = member_name.replace('\\', '/').strip('/').split('/')
+    folders = tuple(tuple(natural_sort_key(folder)) for folder in parts[:-1])
+    return (folders, natural_sort_key(parts[-1]))
+
+
+def is_hidden_member(member_name: str) -> bool:
+    """Check whether an archive member is OS/archiver junk rather than content"""
+    parts = member_name.replace('\\', '/').strip('/').split('/')
+    if any(part == '__MACOSX' or (part.startswith('.') and part != '.') for part in parts):
+        return True
+    return parts[-1].lower() in IGNORED_NAMES
+
+
+def is_image_name(name: str) -> bool:
+    """Check whether a file name has a supported image extension"""
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def order_page_names(names: List[str]) -> List[str]:
+    """Filter a list of member names down to visible images in reading order"""
+    pages = [name for name in names
+             if not name.endswith('/') and is_image_name(name) and not is_hidden_member(name)]
+    return sorted(pages, key=page_sort_key)
+
+
+def build_page_index(zip_file: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """
+    Build the page order of a CBZ from its central directory
+
+    Args:
+        zip_file: Open zip archive
+
+    Returns:
+        ZipInfo entries of the archive's pages in reading order
+    """
+    by_name = {info.filename: info for info in zip_file.infolist() if not info.is_dir()}
+    return [by_name[name] for name in order_page_names(list(by_name))]
+
+
+def get_page_index(file_path: str, zip_file: Optional[zipfile.ZipFile] = None) -> List[str]:
+    """
+    Get the ordered page member names of a CBZ file
+
+    The index is cached per file path, size and modification time, so repeated
+    conversions of an unchanged archive only read its central directory once.
+
+    Args:
+        file_path: Path to the CBZ file
+        zip_file: The archive, if the caller already has it open; on a cache
+            miss the index is built from it instead of opening the file again
+
+    Returns:
+        Member names of the archive's pages in reading order
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_size, stat.st_mtime_ns)
+    with _page_index_lock:
+        names = _PAGE_INDEX_CACHE.get(key)
+        if names is not None:
+            _PAGE_INDEX_CACHE.move_to_end(key)
+            return list(names)
+
+    if zip_file is None:
+        with zipfile.ZipFile(file_path, 'r') as zip_file:
+            names = tuple(info.filename for info in build_page_index(zip_file))
+    else:
+        names = tuple(info.filename for info in build_page_index(zip_file))
+
+    with _page_index_lock:
+        _PAGE_INDEX_CACHE[key] = names
+        while len(_PAGE_INDEX_CACHE) > _PAGE_INDEX_CACHE_SIZE:
+            _PAGE_INDEX_CACHE.popitem(last=False)
+    return list(names)
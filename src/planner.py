@@ -0,0 +1,339 @@
+import heapq
+import json
+import os
+import tarfile
+import zipfile
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from mapped_io import BufferReader, close_map, map_file, open_buffer, stored_zip_member
+from mupdf_lock import MUPDF_LOCK
+from page_order import build_page_index, order_page_names
+from profiles import OutputProfile
+from readers import (Cb7Reader, CbrReader, CbtReader, ImageFolderReader, PdfReader, get_reader_class, py7zr,
+                     rarfile, scan_pdf_images)
+from scheduler import CostModel, input_size
+from thumbnails import DEFAULT_SIZES
+
+
+# Bytes read from the start of each page to parse its image header
+HEADER_BYTES = 64 * 1024
+
+# Image formats of PDF image streams, by filter
+PDF_IMAGE_FORMATS = {
+    'DCTDecode': 'JPEG',
+    'JPXDecode': 'JPEG2000',
+    'FlateDecode': 'PNG',
+    'CCITTFaxDecode': 'CCITT',
+    'JBIG2Decode': 'JBIG2',
+}
+
+# Container overhead per page of each output type (page documents, PDF objects, zip headers)
+PAGE_OVERHEAD = {
+    'cbz': 100,
+    'pdf': 300,
+    'epub': 1200,
+    'images': 0,
+}
+
+
+@dataclass
+class FilePlan:
+    """What a book will take to convert, from its container metadata alone"""
+    path: str
+    format_name: str = ""
+    size: int = 0
+    pages: int = 0
+    image_formats: Counter = field(default_factory=Counter)
+    # Page dimensions, where headers could be read (empty if unknown)
+    page_sizes: List[Tuple[int, int]] = field(default_factory=list, repr=False)
+    image_bytes: int = 0
+    # Whether the converter re-encodes pages (archives) or copies them (PDF)
+    reencoded: bool = True
+    estimated_output: Dict[str, int] = field(default_factory=dict)
+    estimated_seconds: float = 0.0
+    problems: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def supported(self) -> bool:
+        return not self.problems
+
+    def add_page(self, name: str, head, size: int):
+        """Record a page from the first bytes of its data"""
+        self.pages += 1
+        self.image_bytes += size
+        try:
+            with Image.open(open_buffer(head)) as img:
+                self.image_formats[img.format] += 1
+                self.page_sizes.append(img.size)
+        except Exception:
+            self.image_formats['unreadable'] += 1
+
+    def add_image(self, image_format: str, width: int, height: int, size: int):
+        """Record a page whose format and dimensions are already known"""
+        self.pages += 1
+        self.image_bytes += size
+        self.image_formats[image_format] += 1
+        self.page_sizes.append((width, height))
+
+
+def jpeg_bytes(pixels: int, quality: int, grayscale: bool = False) -> int:
+    """Rough JPEG size of a comic page (bits per pixel grow steeply towards quality 100)"""
+    bits_per_pixel = 0.4 + 3.2 * (quality / 100) ** 4
+    if grayscale:
+        bits_per_pixel *= 0.7
+    return int(pixels * bits_per_pixel / 8)
+
+
+def _scaled_pixels(width: int, height: int, profile: OutputProfile) -> int:
+    scale = min((profile.max_width or width) / width, (profile.max_height or height) / height, 1)
+    return int(width * height * scale * scale)
+
+
+def estimate_output_size(plan: FilePlan, profile: OutputProfile) -> int:
+    """
+    Estimated size of one profile's output for a book
+
+    Re-encoded pages are sized from their pixel count with a JPEG model;
+    pages copied as they are (PDF input without transforms) keep their size.
+    """
+    if profile.output_type == 'thumbnails':
+        count = plan.pages if profile.writer_options.get('pages') == 'all' else min(plan.pages, 1)
+        sizes = profile.writer_options.get('sizes') or DEFAULT_SIZES
+        # Pages are about 2:3, so a thumbnail covers two thirds of its bounding square
+        return count * sum(jpeg_bytes(size * size * 2 // 3, 85) for size in sizes)
+
+    pages = plan.pages
+    known = len(plan.page_sizes) == plan.pages and plan.pages > 0
+    if not known:
+        data = plan.image_bytes
+    elif profile.transforms_pages:
+        data = sum(jpeg_bytes(_scaled_pixels(width, height, profile), profile.quality or 95, profile.grayscale)
+                   for width, height in plan.page_sizes)
+        if profile.split:
+            pages += sum(1 for width, height in plan.page_sizes if width >= height * 1.2)
+    elif plan.reencoded:
+        data = sum(jpeg_bytes(width * height, 95) for width, height in plan.page_sizes)
+    else:
+        data = plan.image_bytes
+    return data + pages * PAGE_OVERHEAD.get(profile.output_type, 0)
+
+
+def _pdf_stream_length(document, xref: int) -> int:
+    """Length of an object's stream from its dictionary, without reading the stream"""
+    kind, value = document.xref_get_key(xref, 'Length')
+    if kind == 'int':
+        return int(value)
+    if kind == 'xref':
+        # Indirect length: "12 0 R"
+        return int(document.xref_object(int(value.split()[0])).strip())
+    return 0
+
+
+def _inspect_pdf(plan: FilePlan):
+    plan.reencoded = False
+    with MUPDF_LOCK:
+        document = fitz.open(plan.path)
+        try:
+            if document.needs_pass:
+                plan.problems.append("Encrypted PDF (needs a password)")
+                return
+            images, page_to_image = scan_pdf_images(document)
+            for image in images:
+                plan.add_image(PDF_IMAGE_FORMATS.get(image[8], image[8] or 'raw'), image[2], image[3],
+                               _pdf_stream_length(document, image[0]))
+            # A page whose images all appeared on earlier pages adds no output page
+            first_images = list(page_to_image.values()) + [len(images)]
+            pages_without_images = sum(1 for page_index in range(document.page_count)
+                                       if first_images[page_index] == first_images[page_index + 1])
+            if not images:
+                plan.problems.append("No extractable images (text or vector-only PDF)")
+            elif pages_without_images:
+                plan.warnings.append(f"{pages_without_images} of {document.page_count} PDF pages have no new image "
+                                     f"and will be missing from the output")
+        finally:
+            document.close()
+
+
+def _inspect_zip(plan: FilePlan):
+    mapping = map_file(plan.path)
+    source = BufferReader(mapping) if mapping is not None else plan.path
+    try:
+        with zipfile.ZipFile(source, 'r') as archive:
+            for info in build_page_index(archive):
+                head = stored_zip_member(mapping, info) if mapping is not None else None
+                if head is None:
+                    # Only the start of a deflated member is decompressed
+                    with archive.open(info) as member:
+                        head = member.read(HEADER_BYTES)
+                plan.add_page(info.filename, head[:HEADER_BYTES], info.file_size)
+    finally:
+        if mapping is not None:
+            source.close()
+        close_map(mapping)
+
+
+def _inspect_tar(plan: FilePlan):
+    with tarfile.open(plan.path, 'r:*') as archive:
+        members = {member.name: member for member in archive.getmembers() if member.isfile()}
+        for name in order_page_names(list(members)):
+            plan.add_page(name, archive.extractfile(members[name]).read(HEADER_BYTES), members[name].size)
+
+
+def _inspect_listing(plan: FilePlan, entries: List[Tuple[str, int]]):
+    """Archives whose pages can't be read cheaply (solid 7z, RAR): sizes and formats from the listing"""
+    sizes = dict(entries)
+    for name in order_page_names(list(sizes)):
+        plan.pages += 1
+        plan.image_bytes += sizes[name]
+        plan.image_formats[os.path.splitext(name)[1].lstrip('.').upper()] += 1
+    plan.warnings.append("Image headers not read (compressed archive); estimates use the archive's page sizes")
+
+
+def _inspect_folder(plan: FilePlan):
+    names = []
+    for root, dirs, files in os.walk(plan.path):
+        for file_name in files:
+            names.append(os.path.relpath(os.path.join(root, file_name), plan.path).replace(os.sep, '/'))
+    missing = 0
+    for name in order_page_names(names):
+        file_path = os.path.join(plan.path, name)
+        try:
+            with open(file_path, 'rb') as page_file:
+                plan.add_page(name, page_file.read(HEADER_BYTES), os.path.getsize(file_path))
+        except OSError:
+            # The conversion skips pages it can't read, as here
+            missing += 1
+    if missing:
+        plan.warnings.append(f"{missing} pages can't be read and will be missing from the output")
+
+
+def inspect_file(path: str) -> FilePlan:
+    """
+    Inspect a book's container metadata without decoding any pixels
+
+    Reads the zip central directory, tar headers or PDF page tree and xref
+    table, plus the first bytes of each page for its image header.
+    """
+    plan = FilePlan(path)
+    reader_class = get_reader_class(path)
+    if reader_class is None:
+        plan.problems.append(f"Unsupported format: {os.path.splitext(path)[1].lower() or 'folder without images'}")
+        return plan
+    plan.format_name = reader_class.format_name
+    if not reader_class.is_available():
+        plan.problems.append(f"{reader_class.format_name} support requires an optional dependency "
+                             f"that is not installed")
+        return plan
+
+    try:
+        plan.size = input_size(path)
+        if reader_class is PdfReader:
+            _inspect_pdf(plan)
+        elif reader_class is ImageFolderReader:
+            _inspect_folder(plan)
+        elif reader_class is CbtReader:
+            _inspect_tar(plan)
+        elif reader_class is Cb7Reader:
+            with py7zr.SevenZipFile(path, 'r') as archive:
+                _inspect_listing(plan, [(info.filename, info.uncompressed or 0) for info in archive.list()
+                                        if not info.is_directory])
+        elif reader_class is CbrReader:
+            with rarfile.RarFile(path) as archive:
+                _inspect_listing(plan, [(info.filename, info.file_size) for info in archive.infolist()
+                                        if not info.is_dir()])
+        else:
+            _inspect_zip(plan)
+    except Exception as e:
+        plan.problems.append(f"Unreadable: {str(e)}")
+        return plan
+
+    if plan.pages == 0 and not plan.problems:
+        plan.problems.append("No images found")
+    elif plan.image_formats['unreadable']:
+        plan.warnings.append(f"{plan.image_formats['unreadable']} pages have unreadable image headers "
+                             f"and will likely be skipped")
+    return plan
+
+
+def plan_files(file_paths: List[str], profiles: List[OutputProfile], cost_model: Optional[CostModel] = None,
+               update_progress: Optional[Callable[[FilePlan], None]] = None) -> List[FilePlan]:
+    """
+    Inspect every book and estimate its outputs and conversion time
+
+    Args:
+        file_paths: Books to plan
+        profiles: Output profiles the run would write
+        cost_model: Throughput model (e.g. CostModel.load of a previous --schedule-report)
+        update_progress: Called with each file's plan
+
+    Returns:
+        One FilePlan per book, in the given order
+    """
+    cost_model = cost_model or CostModel()
+    plans = []
+    for file_path in file_paths:
+        plan = inspect_file(file_path)
+        if plan.supported:
+            plan.estimated_output = {profile.name: estimate_output_size(plan, profile) for profile in profiles}
+            plan.estimated_seconds = cost_model.predict_seconds(plan.size, plan.pages)
+        plans.append(plan)
+        if update_progress:
+            update_progress(plan)
+    return plans
+
+
+def estimate_makespan(seconds: List[float], jobs: int) -> float:
+    """Wall time of running jobs largest-first on parallel workers, as the batch scheduler does"""
+    workers = [0.0] * max(1, jobs)
+    for duration in sorted(seconds, reverse=True):
+        heapq.heappush(workers, heapq.heappop(workers) + duration)
+    return max(workers)
+
+
+def plan_report(plans: List[FilePlan], cost_model: Optional[CostModel] = None, jobs: int = 1) -> Dict:
+    """Summary of a batch plan, with per-file details"""
+    cost_model = cost_model or CostModel()
+    supported = [plan for plan in plans if plan.supported]
+    output_by_profile = Counter()
+    formats = Counter()
+    for plan in supported:
+        output_by_profile.update(plan.estimated_output)
+        formats.update(plan.image_formats)
+    seconds = [plan.estimated_seconds for plan in supported]
+    return {
+        'files': len(plans),
+        'supported': len(supported),
+        'unsupported': [{'path': plan.path, 'problems': plan.problems} for plan in plans if not plan.supported],
+        'pages': sum(plan.pages for plan in supported),
+        'input_bytes': sum(plan.size for plan in supported),
+        'image_formats': dict(formats),
+        'estimated_output_bytes': sum(output_by_profile.values()),
+        'estimated_output_by_profile': dict(output_by_profile),
+        'estimated_seconds': sum(seconds),
+        'estimated_wall_seconds': estimate_makespan(seconds, jobs),
+        'jobs': jobs,
+        'model': asdict(cost_model),
+        'plans': [{
+            'path': plan.path,
+            'format': plan.format_name,
+            'size': plan.size,
+            'pages': plan.pages,
+            'image_formats': dict(plan.image_formats),
+            'estimated_output': plan.estimated_output,
+            'estimated_seconds': plan.estimated_seconds,
+            'problems': plan.problems,
+            'warnings': plan.warnings,
+        } for plan in plans],
+    }
+
+
+def write_plan_report(report: Dict, report_path: str):
+    """Write a batch plan as JSON"""
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
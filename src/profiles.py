@@ -0,0 +1,204 @@
+import io
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+import analysis
+from readers import Page
+from writers import WRITERS, ComicWriter, parse_output_types
+
+
+@dataclass
+class OutputProfile:
+    """
+    One output of a conversion: a writer plus optional page transforms
+
+    Profiles without transforms receive the source page bytes untouched.
+    Profiles with transforms share the decoded page image and re-encode it.
+    """
+    output_type: str
+    suffix: str = ""
+    max_width: Optional[int] = None
+    max_height: Optional[int] = None
+    quality: Optional[int] = None
+    grayscale: bool = False
+    trim: bool = False
+    split: bool = False
+    rtl: bool = False
+    writer_options: Dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        """Human-readable profile name (e.g. 'cbz_phone')"""
+        return f"{self.output_type}{self.suffix}"
+
+    @property
+    def transforms_pages(self) -> bool:
+        """Whether this profile needs decoded pages rather than source bytes"""
+        return bool(self.max_width or self.max_height or self.quality or self.grayscale
+                    or self.trim or self.split)
+
+    def transform(self, page: Page, image: Image.Image) -> List[Page]:
+        """
+        Apply this profile's transforms to a decoded page and encode the result as JPEG
+
+        Returns a list because splitting a spread turns one page into two.
+        Pages keep the source index; the profile worker renumbers them.
+        """
+        images = analysis.analyze_page(image, self.trim, self.split, self.rtl) if self.trim or self.split else [image]
+        pages = []
+        for image in images:
+            if self.grayscale:
+                image = image.convert('L')
+
+            max_width = self.max_width or image.width
+            max_height = self.max_height or image.height
+            scale = min(max_width / image.width, max_height / image.height)
+            if scale < 1:
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                image = image.resize(size, Image.Resampling.LANCZOS)
+
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=self.quality or 95)
+            pages.append(Page(page.index, f"{page.index:03d}.jpeg", buffer.getvalue(), image))
+        return pages
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+
+PROFILE_OPTIONS = {
+    'suffix': str,
+    'max_width': int,
+    'max_height': int,
+    'quality': int,
+    'grayscale': _parse_bool,
+    'trim': _parse_bool,
+    'split': _parse_bool,
+    'rtl': _parse_bool,
+}
+
+
+def parse_profile(spec: str) -> OutputProfile:
+    """
+    Parse a profile specification
+
+    Format: TYPE[:OPTION=VALUE,...], e.g. 'cbz:suffix=_phone,max_height=1600,quality=80'.
+    Options not in PROFILE_OPTIONS are passed to the writer if it declares
+    them (e.g. 'pdf:save=fast').
+
+    Raises:
+        ValueError: If the output type or an option is invalid
+    """
+    output_type, _, options = spec.partition(':')
+    output_type = output_type.strip().lower()
+    if output_type not in WRITERS:
+        raise ValueError(f"Unsupported output type: {output_type}")
+
+    writer_options = WRITERS[output_type].options
+    values = {}
+    extra = {}
+    for option in filter(None, (item.strip() for item in options.split(','))):
+        key, separator, value = option.partition('=')
+        key = key.strip().replace('-', '_')
+        if separator and key in PROFILE_OPTIONS:
+            values[key] = PROFILE_OPTIONS[key](value.strip())
+        elif separator and key in writer_options:
+            extra[key] = writer_options[key](value.strip())
+        else:
+            raise ValueError(f"Invalid profile option '{option}' in '{spec}'")
+
+    return OutputProfile(output_type, writer_options=extra, **values)
+
+
+def parse_profiles(output_type) -> List[OutputProfile]:
+    """
+    Normalize an output specification into profiles
+
+    Args:
+        output_type: Output type string ('cbz' or 'cbz,pdf'), or a list of
+            output type strings and/or OutputProfile objects
+
+    Raises:
+        ValueError: If an output type is unsupported or two profiles share an output name
+    """
+    items = [output_type] if isinstance(output_type, (str, OutputProfile)) else list(output_type)
+    profiles = []
+    for item in items:
+        if isinstance(item, OutputProfile):
+            parse_output_types(item.output_type)
+            profiles.append(item)
+        else:
+            profiles.extend(OutputProfile(name) for name in parse_output_types(item))
+
+    names = [profile.name for profile in profiles]
+    if not profiles:
+        raise ValueError("No output type given")
+    if len(set(names)) != len(names):
+        raise ValueError("Several profiles write the same output; give them different suffixes")
+    if any(profile.trim for profile in profiles) and not analysis.is_available():
+        raise ValueError("Border trimming requires numpy (install the 'analysis' extra)")
+    return profiles
+
+
+class ProfileWorker:
+    """
+    Runs one profile's transforms and writer on its own thread
+
+    Pages are queued in reading order and processed in that order, so the
+    writer sees the same sequence as a synchronous conversion. Pillow releases
+    the GIL while resizing and encoding, so profiles encode in parallel.
+    """
+
+    def __init__(self, profile: OutputProfile, writer: ComicWriter, queue_size: int = 8):
+        self.profile = profile
+        self.writer = writer
+        self.error = None
+        self.pages_written = 0
+        # Source page index -> index of its first page in this output
+        self.page_map: Dict[int, int] = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name=f"profile-{profile.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            page, image, source_index = item
+            try:
+                pages = self.profile.transform(page, image) if self.profile.transforms_pages else [page]
+                if pages:
+                    self.page_map[source_index] = self.pages_written
+                for output_page in pages:
+                    if output_page.index != self.pages_written:
+                        output_page = Page(self.pages_written,
+                                           f"{self.pages_written:03d}.{output_page.extension or 'jpeg'}",
+                                           output_page.data, output_page.image)
+                    self.writer.add_page(output_page)
+                    self.pages_written += 1
+            except Exception as e:
+                self.error = e
+
+    def submit(self, page: Page, image: Optional[Image.Image], source_index: Optional[int] = None):
+        """
+        Queue a page (and its shared decoded image, if any) for this profile
+
+        source_index is the page's index in the source book (defaults to
+        page.index), recorded in page_map so metadata can be renumbered.
+        """
+        self._queue.put((page, image, page.index if source_index is None else source_index))
+
+    def finish(self):
+        """Wait until every queued page has been written; re-raises worker errors"""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
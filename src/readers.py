@@ -0,0 +1,505 @@
+import fitz  # PyMuPDF
+import functools
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+from PIL import Image
+
+from mapped_io import BufferReader, close_map, map_file, stored_zip_member, tar_member
+from mupdf_lock import MUPDF_LOCK
+from metadata import build_comicinfo, find_comicinfo, pdf_to_comicinfo, COMICINFO_NAME
+from page_order import build_page_index, get_page_index, order_page_names, is_image_name, is_hidden_member
+
+try:
+    import py7zr
+except ImportError:
+    py7zr = None
+
+try:
+    import rarfile
+except ImportError:
+    rarfile = None
+
+
+@dataclass
+class Page:
+    """A single encoded page image produced by a reader"""
+    index: int
+    name: str
+    # Encoded bytes, or a memoryview into a memory-mapped source (see mapped_io)
+    data: Union[bytes, memoryview]
+    # Decoded image, when the conversion already decoded the page (never set by readers)
+    image: Optional[Image.Image] = field(default=None, repr=False, compare=False)
+
+    @property
+    def extension(self) -> str:
+        """Lower-case file extension of the page's source name, without the dot"""
+        return os.path.splitext(self.name)[1].lower().lstrip('.')
+
+
+class ComicReader:
+    """
+    Base class for input formats
+
+    Readers yield pages in reading order through iter_pages(), so conversion
+    code never needs to know the container format. Subclasses list their
+    pages in page_names, read one page in _read_page(), and register
+    themselves for their file extensions with @register_reader.
+    """
+    format_name = ""
+    extensions = ()
+    # Whether pages should be re-encoded to JPEG before packaging
+    reencode_pages = True
+    # (offset, bytes) signatures identifying the format when reading from a stream
+    signatures: Tuple[Tuple[int, bytes], ...] = ()
+
+    def __init__(self, path: Union[str, BinaryIO]):
+        # A file path, or a seekable binary stream (see open_source)
+        self.path = path
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check whether the optional dependencies of this reader are installed"""
+        return True
+
+    # Names of the pages in reading order
+    page_names: List[str] = []
+
+    def page_count(self) -> int:
+        """Number of pages iter_pages() will yield"""
+        return len(self.page_names)
+
+    def _read_page(self, index: int, name: str) -> Page:
+        """Read one page"""
+        raise NotImplementedError
+
+    def iter_page_entries(self) -> Iterator[Tuple[int, str, Callable[[], Page]]]:
+        """
+        Yield (index, name, read) for each page in reading order, without reading it
+
+        read() returns the Page. A damaged member (bad CRC, truncated data)
+        raises from read() rather than from the iterator, so callers can skip
+        the bad page and carry on with the rest of the book.
+        """
+        for index, name in enumerate(self.page_names):
+            yield index, name, functools.partial(self._read_page, index, name)
+
+    def iter_pages(self) -> Iterator[Page]:
+        """Yield the pages of the book in reading order (a damaged page raises)"""
+        for _, _, read in self.iter_page_entries():
+            yield read()
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        """Return ComicInfo.xml content for the book, if any"""
+        return None
+
+    def close(self):
+        """Release any open handles"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+READERS: Dict[str, Type[ComicReader]] = {}
+
+
+def register_reader(reader_class: Type[ComicReader]) -> Type[ComicReader]:
+    """Class decorator registering a reader for its file extensions"""
+    for extension in reader_class.extensions:
+        READERS[extension] = reader_class
+    return reader_class
+
+
+def supported_extensions() -> List[str]:
+    """File extensions that have a reader with its dependencies installed"""
+    return sorted(ext for ext, reader_class in READERS.items() if reader_class.is_available())
+
+
+def open_source(source) -> BinaryIO:
+    """
+    Turn bytes or a binary stream into a seekable stream readers can use
+
+    Archives need random access, so non-seekable streams (pipes, sockets)
+    are read into memory first.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if not source.seekable():
+        return io.BytesIO(source.read())
+    return source
+
+
+def detect_reader_class(stream: BinaryIO) -> Optional[Type[ComicReader]]:
+    """Identify a stream's format from its leading bytes"""
+    start = stream.tell()
+    head = stream.read(512)
+    stream.seek(start)
+    for reader_class in dict.fromkeys(READERS.values()):
+        if any(head[offset:offset + len(signature)] == signature
+               for offset, signature in reader_class.signatures):
+            return reader_class
+    return None
+
+
+def is_image_folder(path: str) -> bool:
+    """Check whether a directory directly contains page images"""
+    if not os.path.isdir(path):
+        return False
+    return any(is_image_name(name) and not is_hidden_member(name)
+               for name in os.listdir(path))
+
+
+def get_reader_class(path: str) -> Optional[Type[ComicReader]]:
+    """
+    Find the reader for an input path
+
+    Directories of images use the folder reader. CBR/CB7 files that are really
+    zip archives (a common mislabeling) are read as CBZ. Streams have no
+    extension, so their format is detected from their content.
+
+    Args:
+        path: Input file or directory, or a seekable binary stream
+
+    Returns:
+        Reader class, or None if the format is unsupported
+    """
+    if not isinstance(path, str):
+        return detect_reader_class(path)
+    if os.path.isdir(path):
+        return ImageFolderReader if is_image_folder(path) else None
+
+    extension = os.path.splitext(path)[1].lower()
+    reader_class = READERS.get(extension)
+    if reader_class in (CbrReader, Cb7Reader) and zipfile.is_zipfile(path):
+        return CbzReader
+    return reader_class
+
+
+def scan_pdf_images(document: fitz.Document) -> Tuple[List[tuple], Dict[int, int]]:
+    """
+    Find the images of a PDF that become output pages
+
+    Each unique image xref is one page, in the order pages first use it;
+    images shared between pages (logos, repeated backgrounds) appear once.
+    Callers must hold MUPDF_LOCK.
+
+    Returns:
+        The get_page_images(full=True) entry of each unique image, and the
+        index of each PDF page's first new image
+    """
+    images = []
+    seen = set()
+    page_to_image = {}
+    for page_index in range(document.page_count):
+        page_to_image[page_index] = len(images)
+        for image in document.get_page_images(page_index, full=True):
+            if image[0] not in seen:
+                seen.add(image[0])
+                images.append(image)
+    return images, page_to_image
+
+
+def _pillow_can_open(data: bytes) -> bool:
+    """Check whether Pillow recognizes image data (only the header is parsed)"""
+    try:
+        with Image.open(io.BytesIO(data)):
+            return True
+    except Exception:
+        return False
+
+
+def open_reader(path) -> ComicReader:
+    """
+    Open a reader for an input path, bytes, or a binary stream
+
+    Raises:
+        ValueError: If the format is unsupported
+        ImportError: If the reader's optional dependency is missing
+    """
+    if not isinstance(path, str):
+        path = open_source(path)
+        reader_class = get_reader_class(path)
+        if reader_class is None:
+            raise ValueError("Unsupported stream format")
+    else:
+        reader_class = get_reader_class(path)
+    if reader_class is None:
+        raise ValueError(f"Unsupported file format: {os.path.splitext(path)[1].lower() or path}")
+    if not reader_class.is_available():
+        raise ImportError(f"{reader_class.format_name} support requires an optional dependency "
+                          f"that is not installed")
+    return reader_class(path)
+
+
+@register_reader
+class PdfReader(ComicReader):
+    """Reads embedded images from PDF pages, skipping images shared between pages"""
+    format_name = "PDF"
+    extensions = ('.pdf',)
+    reencode_pages = False
+    signatures = ((0, b'%PDF'),)
+
+    def __init__(self, path: Union[str, BinaryIO]):
+        super().__init__(path)
+        self._map = map_file(path) if isinstance(path, str) else None
+        with MUPDF_LOCK:
+            if self._map is not None:
+                # MuPDF reads the mapping in place rather than through buffered file reads
+                self.document = fitz.open(stream=memoryview(self._map), filetype='pdf')
+            elif isinstance(path, str):
+                self.document = fitz.open(path)
+            else:
+                self.document = fitz.open(stream=path.read(), filetype='pdf')
+        self._xrefs = None
+        self._page_to_image = None
+
+    def _scan_images(self) -> List[int]:
+        """Collect unique image xrefs in page order and the first image of each page"""
+        if self._xrefs is None:
+            with MUPDF_LOCK:
+                images, self._page_to_image = scan_pdf_images(self.document)
+            self._xrefs = [image[0] for image in images]
+        return self._xrefs
+
+    @property
+    def page_names(self) -> List[str]:
+        return [f"{index:03d}" for index in range(len(self._scan_images()))]
+
+    def _read_page(self, index: int, name: str) -> Page:
+        xref = self._scan_images()[index]
+        with MUPDF_LOCK:
+            base_image = self.document.extract_image(xref)
+        if not base_image:
+            raise ValueError(f"image {xref} could not be extracted")
+        extension, data = base_image['ext'], base_image['image']
+        if not is_image_name(f".{extension}") and not _pillow_can_open(data):
+            # e.g. JBIG2: only MuPDF can decode it, so hand out a lossless PNG
+            with MUPDF_LOCK:
+                pixmap = fitz.Pixmap(self.document, xref)
+                if pixmap.n - pixmap.alpha > 3:
+                    pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+                extension, data = 'png', pixmap.tobytes('png')
+        return Page(index, f"{name}.{extension}", data)
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        xrefs = self._scan_images()
+        with MUPDF_LOCK:
+            metadata, toc = self.document.metadata, self.document.get_toc()
+        info = pdf_to_comicinfo(metadata, toc, self._page_to_image)
+        if not info or not xrefs:
+            return None
+        info['PageCount'] = str(len(xrefs))
+        return build_comicinfo(info)
+
+    def close(self):
+        with MUPDF_LOCK:
+            self.document.close()
+            self.document.stream = None
+        close_map(self._map)
+
+
+@register_reader
+class CbzReader(ComicReader):
+    """Reads pages from a zip archive in natural, folder-aware order"""
+    format_name = "CBZ"
+    extensions = ('.cbz',)
+    signatures = ((0, b'PK\x03\x04'), (0, b'PK\x05\x06'))
+
+    def __init__(self, path: Union[str, BinaryIO]):
+        super().__init__(path)
+        self._map = map_file(path) if isinstance(path, str) else None
+        self._source = BufferReader(self._map) if self._map is not None else path
+        self.archive = zipfile.ZipFile(self._source, 'r')
+        if isinstance(path, str):
+            # Built from the archive opened above; no second read of the central directory
+            self.page_names = get_page_index(path, self.archive)
+        else:
+            self.page_names = [info.filename for info in build_page_index(self.archive)]
+
+    def _read_page(self, index: int, name: str) -> Page:
+        if self._map is not None:
+            # Stored members (the norm for comics) are sliced out of the mapping without a copy
+            data = stored_zip_member(self._map, self.archive.getinfo(name))
+            if data is not None:
+                return Page(index, name, data)
+        return Page(index, name, self.archive.read(name))
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        member = find_comicinfo(self.archive)
+        return self.archive.read(member) if member is not None else None
+
+    def close(self):
+        self.archive.close()
+        if self._map is not None:
+            self._source.close()
+        close_map(self._map)
+
+
+@register_reader
+class CbtReader(ComicReader):
+    """Reads pages from a (optionally compressed) tar archive"""
+    format_name = "CBT"
+    extensions = ('.cbt',)
+    # Plain tar, or tar compressed with gzip, bzip2 or xz
+    signatures = ((257, b'ustar'), (0, b'\x1f\x8b'), (0, b'BZh'), (0, b'\xfd7zXZ\x00'))
+
+    def __init__(self, path: Union[str, BinaryIO]):
+        super().__init__(path)
+        self._map = map_file(path) if isinstance(path, str) else None
+        self.archive = None
+        if self._map is not None:
+            # Members of an uncompressed tar are contiguous, so pages can be sliced from the mapping
+            self._source = BufferReader(self._map)
+            try:
+                self.archive = tarfile.open(fileobj=self._source, mode='r:')
+            except tarfile.ReadError:
+                self._source.close()
+                close_map(self._map)
+                self._map = None
+        if self.archive is None:
+            if isinstance(path, str):
+                self.archive = tarfile.open(path, 'r:*')
+            else:
+                self.archive = tarfile.open(fileobj=path, mode='r:*')
+        members = {member.name: member for member in self.archive.getmembers() if member.isfile()}
+        self.members = members
+        self.page_names = order_page_names(list(members))
+
+    def _read_page(self, index: int, name: str) -> Page:
+        member = self.members[name]
+        data = tar_member(self._map, member) if self._map is not None else None
+        if data is None:
+            data = self.archive.extractfile(member).read()
+        return Page(index, name, data)
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        for name, member in self.members.items():
+            if os.path.basename(name).lower() == COMICINFO_NAME.lower():
+                return self.archive.extractfile(member).read()
+        return None
+
+    def close(self):
+        self.archive.close()
+        if self._map is not None:
+            self._source.close()
+        close_map(self._map)
+
+
+@register_reader
+class Cb7Reader(ComicReader):
+    """Reads pages from a 7z archive (requires py7zr)"""
+    format_name = "CB7"
+    extensions = ('.cb7',)
+    signatures = ((0, b"7z\xbc\xaf'\x1c"),)
+
+    def __init__(self, path: Union[str, BinaryIO]):
+        super().__init__(path)
+        with py7zr.SevenZipFile(path, 'r') as archive:
+            names = archive.getnames()
+        self.page_names = order_page_names(names)
+        self.comicinfo_name = next((name for name in names
+                                    if os.path.basename(name).lower() == COMICINFO_NAME.lower()), None)
+        self._extract_dir = None
+        self._extract_error = None
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return py7zr is not None
+
+    def _extracted_path(self, name: str) -> str:
+        # 7z archives are usually solid, so members are decompressed in one sequential pass
+        if self._extract_dir is None:
+            self._extract_dir = tempfile.TemporaryDirectory()
+            targets = list(self.page_names)
+            if self.comicinfo_name:
+                targets.append(self.comicinfo_name)
+            if not isinstance(self.path, str):
+                self.path.seek(0)
+            try:
+                with py7zr.SevenZipFile(self.path, 'r') as archive:
+                    archive.extract(path=self._extract_dir.name, targets=targets)
+            except Exception as e:
+                # Members extracted before a damaged one are still readable
+                self._extract_error = e
+        path = os.path.join(self._extract_dir.name, name)
+        if self._extract_error is not None and not os.path.isfile(path):
+            raise self._extract_error
+        return path
+
+    def _read_page(self, index: int, name: str) -> Page:
+        with open(self._extracted_path(name), 'rb') as page_file:
+            return Page(index, name, page_file.read())
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        if not self.comicinfo_name:
+            return None
+        with open(self._extracted_path(self.comicinfo_name), 'rb') as comicinfo_file:
+            return comicinfo_file.read()
+
+    def close(self):
+        if self._extract_dir is not None:
+            self._extract_dir.cleanup()
+            self._extract_dir = None
+
+
+@register_reader
+class CbrReader(ComicReader):
+    """Reads pages from a RAR archive (requires rarfile and an unrar backend)"""
+    format_name = "CBR"
+    extensions = ('.cbr',)
+    signatures = ((0, b'Rar!\x1a\x07'),)
+
+    def __init__(self, path: Union[str, BinaryIO]):
+        super().__init__(path)
+        self.archive = rarfile.RarFile(path)
+        self.page_names = order_page_names([info.filename for info in self.archive.infolist()
+                                            if not info.is_dir()])
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return rarfile is not None
+
+    def _read_page(self, index: int, name: str) -> Page:
+        return Page(index, name, self.archive.read(name))
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        for name in self.archive.namelist():
+            if os.path.basename(name).lower() == COMICINFO_NAME.lower():
+                return self.archive.read(name)
+        return None
+
+    def close(self):
+        self.archive.close()
+
+
+class ImageFolderReader(ComicReader):
+    """Reads pages from a directory of images (including chapter subfolders)"""
+    format_name = "Image folder"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        names = []
+        for root, dirs, files in os.walk(path):
+            for file_name in files:
+                names.append(os.path.relpath(os.path.join(root, file_name), path).replace(os.sep, '/'))
+        self.page_names = order_page_names(names)
+
+    def _read_page(self, index: int, name: str) -> Page:
+        with open(os.path.join(self.path, name), 'rb') as page_file:
+            return Page(index, name, page_file.read())
+
+    def read_comicinfo(self) -> Optional[bytes]:
+        comicinfo_path = os.path.join(self.path, COMICINFO_NAME)
+        if not os.path.isfile(comicinfo_path):
+            return None
+        with open(comicinfo_path, 'rb') as comicinfo_file:
+            return comicinfo_file.read()
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+import time
+import zipfile
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from mupdf_lock import MUPDF_LOCK
+from page_order import build_page_index, order_page_names
+from readers import scan_pdf_images
+
+
+# Assumed size of one page when an archive's page count can't be read cheaply
+AVERAGE_PAGE_BYTES = 512 * 1024
+
+
+@dataclass
+class CostModel:
+    """
+    Linear model of conversion cost, tunable from measured runs
+
+    Time is predicted as seconds_per_mb * size + seconds_per_page * pages.
+    Memory is the decoded pages in flight (compressed page size times
+    decode_expansion) plus the whole output for writers that build it in memory.
+    """
+    seconds_per_mb: float = 0.02
+    seconds_per_page: float = 0.05
+    decode_expansion: float = 8.0
+    pages_in_flight: int = 10
+
+    def predict_seconds(self, size: int, pages: int) -> float:
+        return self.seconds_per_mb * size / (1024 * 1024) + self.seconds_per_page * pages
+
+    def predict_memory(self, size: int, pages: int, in_memory_output: bool = False) -> int:
+        page_bytes = size / max(pages, 1)
+        memory = page_bytes * self.decode_expansion * min(self.pages_in_flight, max(pages, 1))
+        if in_memory_output:
+            memory += size
+        return int(memory)
+
+    @classmethod
+    def fit(cls, results: List['JobResult'], base: Optional['CostModel'] = None) -> 'CostModel':
+        """
+        Refit the time coefficients to measured job times by least squares
+
+        Memory settings are carried over from base. With too few distinct
+        jobs to solve for both coefficients, base is returned unchanged.
+        """
+        base = base or cls()
+        samples = [(result.size / (1024 * 1024), result.pages, result.actual_seconds)
+                   for result in results if result.success]
+        sxx = sum(mb * mb for mb, _, _ in samples)
+        sxy = sum(mb * pages for mb, pages, _ in samples)
+        syy = sum(pages * pages for _, pages, _ in samples)
+        sxt = sum(mb * seconds for mb, _, seconds in samples)
+        syt = sum(pages * seconds for _, pages, seconds in samples)
+        determinant = sxx * syy - sxy * sxy
+        if len(samples) < 2 or abs(determinant) < 1e-9:
+            return base
+        seconds_per_mb = (sxt * syy - syt * sxy) / determinant
+        seconds_per_page = (syt * sxx - sxt * sxy) / determinant
+        # A negative coefficient means the other term explains the data alone
+        if seconds_per_mb < 0:
+            seconds_per_mb, seconds_per_page = 0.0, syt / syy if syy else base.seconds_per_page
+        elif seconds_per_page < 0:
+            seconds_per_mb, seconds_per_page = sxt / sxx if sxx else base.seconds_per_mb, 0.0
+        return cls(seconds_per_mb, seconds_per_page, base.decode_expansion, base.pages_in_flight)
+
+    @classmethod
+    def load(cls, path: str) -> 'CostModel':
+        """Load a model from JSON (a model file or a schedule report's 'fitted_model')"""
+        with open(path, 'r', encoding='utf-8') as model_file:
+            data = json.load(model_file)
+        data = data.get('fitted_model', data)
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+
+@dataclass
+class JobEstimate:
+    """Predicted cost of converting one book"""
+    path: str
+    size: int
+    pages: int
+    seconds: float
+    memory: int
+
+
+@dataclass
+class JobResult:
+    """Predicted and measured cost of one converted book"""
+    path: str
+    size: int
+    pages: int
+    predicted_seconds: float
+    actual_seconds: float
+    memory: int
+    success: bool
+    error: Optional[str] = None
+
+
+def _folder_files(path: str) -> List[str]:
+    return [os.path.join(root, file_name) for root, dirs, files in os.walk(path) for file_name in files]
+
+
+def count_pages(path: str) -> Optional[int]:
+    """
+    Page count from container metadata only, or None if not cheaply available
+
+    Zip-based archives are counted from the central directory and PDFs by
+    their unique images, as PdfReader pages them; no page data is read.
+    """
+    try:
+        if os.path.isdir(path):
+            return len(order_page_names([os.path.relpath(file_path, path).replace(os.sep, '/')
+                                         for file_path in _folder_files(path)]))
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path, 'r') as archive:
+                return len(build_page_index(archive))
+        if path.lower().endswith('.pdf'):
+            with MUPDF_LOCK, fitz.open(path) as document:
+                return len(scan_pdf_images(document)[0])
+    except Exception:
+        pass
+    return None
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # e.g. a broken link; the conversion skips the page
+        return 0
+
+
+def input_size(path: str) -> int:
+    """
+    Size in bytes of a comic file, or of the readable files in an image folder (including subfolders)
+
+    Raises:
+        OSError: If a comic file can't be accessed
+    """
+    if os.path.isdir(path):
+        return sum(_file_size(file_path) for file_path in _folder_files(path))
+    return os.path.getsize(path)
+
+
+def estimate_job(path: str, model: CostModel, in_memory_output: bool = False) -> JobEstimate:
+    """
+    Predict the time and memory needed to convert one book
+
+    A book that can't be measured (deleted, or a folder with a broken
+    link) gets a minimal estimate; its conversion then reports the failure,
+    so one bad file never stops the batch.
+    """
+    try:
+        size = input_size(path)
+    except OSError:
+        size = 0
+    pages = count_pages(path)
+    if pages is None:
+        pages = max(1, size // AVERAGE_PAGE_BYTES)
+    return JobEstimate(path, size, pages, model.predict_seconds(size, pages),
+                       model.predict_memory(size, pages, in_memory_output))
+
+
+def order_jobs(estimates: List[JobEstimate]) -> List[JobEstimate]:
+    """Longest predicted jobs first, so a large book never starts last and stretches the run"""
+    return sorted(estimates, key=lambda estimate: estimate.seconds, reverse=True)
+
+
+class BatchScheduler:
+    """
+    Runs conversion jobs on parallel threads within a memory budget
+
+    Jobs are started in the given order whenever a worker is free and the
+    job's predicted memory fits in what is left of the budget; if the next
+    job doesn't fit, a smaller one further down the list may start instead.
+    A job larger than the whole budget still runs, but only on its own.
+
+    Jobs share one process, so their PyMuPDF calls are serialized behind
+    MUPDF_LOCK (see mupdf_lock): PDF reading and writing don't overlap
+    between jobs, while image decoding, encoding and archive work do.
+    """
+
+    def __init__(self, jobs: int = 1, memory_budget: Optional[int] = None):
+        self.jobs = max(1, jobs)
+        self.memory_budget = memory_budget
+        self._condition = threading.Condition()
+        self._running = 0
+        self._reserved = 0
+
+    def _fits(self, estimate: JobEstimate) -> bool:
+        if self._running >= self.jobs:
+            return False
+        if self.memory_budget is None or self._running == 0:
+            return True
+        return self._reserved + estimate.memory <= self.memory_budget
+
+    def run(self, estimates: List[JobEstimate], convert: Callable[[str], bool],
+            on_start: Optional[Callable[[JobEstimate], None]] = None,
+            on_finish: Optional[Callable[[JobResult], None]] = None) -> List[JobResult]:
+        """
+        Convert every job, returning their results in completion order
+
+        Args:
+            estimates: Jobs in the order they should be started
+            convert: Converts one path, returning True on success
+            on_start: Called when a job starts
+            on_finish: Called with each job's result (callbacks are serialized)
+        """
+        pending = list(estimates)
+        results = []
+        threads = []
+
+        def run_job(estimate: JobEstimate):
+            start = time.perf_counter()
+            success, error = False, None
+            try:
+                success = bool(convert(estimate.path))
+            except Exception as e:
+                error = str(e)
+            result = JobResult(estimate.path, estimate.size, estimate.pages, estimate.seconds,
+                               time.perf_counter() - start, estimate.memory, success, error)
+            with self._condition:
+                self._running -= 1
+                self._reserved -= estimate.memory
+                results.append(result)
+                if on_finish:
+                    on_finish(result)
+                self._condition.notify_all()
+
+        with self._condition:
+            while pending:
+                estimate = next((estimate for estimate in pending if self._fits(estimate)), None)
+                if estimate is None:
+                    self._condition.wait()
+                    continue
+                pending.remove(estimate)
+                self._running += 1
+                self._reserved += estimate.memory
+                if on_start:
+                    on_start(estimate)
+                thread = threading.Thread(target=run_job, args=(estimate,), daemon=True,
+                                          name=f"job-{os.path.basename(estimate.path)}")
+                thread.start()
+                threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+        return results
+
+
+def schedule_report(results: List[JobResult], model: CostModel, wall_seconds: float) -> Dict:
+    """
+    Compare predicted with measured job times
+
+    The report includes a cost model refitted to this run; load it with
+    CostModel.load to make the next run's predictions more accurate.
+    """
+    measured = [result for result in results if result.success]
+    errors = [abs(result.actual_seconds - result.predicted_seconds) / result.actual_seconds
+              for result in measured if result.actual_seconds > 0]
+    return {
+        'wall_seconds': wall_seconds,
+        'predicted_seconds': sum(result.predicted_seconds for result in results),
+        'actual_seconds': sum(result.actual_seconds for result in results),
+        'mean_relative_error': sum(errors) / len(errors) if errors else None,
+        'model': asdict(model),
+        'fitted_model': asdict(CostModel.fit(results, model)),
+        'jobs': [asdict(result) for result in results],
+    }
+
+
+def write_schedule_report(report: Dict, report_path: str):
+    """Write a schedule report as JSON"""
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
@@ -0,0 +1,179 @@
+import glob
+import hashlib
+import json
+import os
+import socket
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+from scheduler import CostModel, JobResult
+
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parse a shard specification 'I/N' (1 <= I <= N)
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    index, separator, count = spec.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected I/N (e.g. 2/4)")
+    if not separator or count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}', expected I/N with 1 <= I <= N")
+    return index, count
+
+
+def shard_key(file_path: str, root: str) -> str:
+    """Name identifying a book across hosts: its path relative to the scanned directory"""
+    if os.path.isdir(root):
+        key = os.path.relpath(os.path.normpath(file_path), os.path.normpath(root))
+        if key != '.':
+            return key.replace(os.sep, '/')
+    return os.path.basename(os.path.normpath(file_path))
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Shard (1-based) that a book belongs to
+
+    Uses a content hash of the key rather than hash(), which is salted per
+    process, so every host computes the same partition without coordinating.
+    """
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def select_shard(file_paths: List[str], root: str, index: int, count: int) -> List[str]:
+    """Books of the scanned set that belong to shard index of count"""
+    return [file_path for file_path in file_paths if shard_of(shard_key(file_path, root), count) == index]
+
+
+def manifest_path_for(output_dir: str, index: int, count: int) -> str:
+    """Default manifest location, shared by every shard writing to one output directory"""
+    return os.path.join(output_dir, f"shard-{index}-of-{count}{MANIFEST_SUFFIX}")
+
+
+def build_manifest(index: int, count: int, root: str, schedule: Dict, scanned: int) -> Dict:
+    """
+    Result manifest of one shard's run
+
+    Args:
+        index: Shard number (1-based)
+        count: Total number of shards
+        root: Scanned input path
+        schedule: Schedule report of the shard's conversions (ConversionProgress.schedule)
+        scanned: Number of books in the whole scanned set
+    """
+    files = []
+    for job in schedule['jobs']:
+        files.append(dict(job, key=shard_key(job['path'], root)))
+    return {
+        'shard': index,
+        'shard_count': count,
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'root': os.path.abspath(root),
+        'scanned': scanned,
+        'wall_seconds': schedule['wall_seconds'],
+        'model': schedule['model'],
+        'files': files,
+    }
+
+
+def write_manifest(manifest: Dict, manifest_path: str):
+    """Write a shard manifest atomically, so a merge never reads a partial file"""
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def load_manifests(path: str) -> List[Dict]:
+    """Load a manifest file, or every *.manifest.json in a directory"""
+    if os.path.isdir(path):
+        paths = sorted(glob.glob(os.path.join(glob.escape(path), f"*{MANIFEST_SUFFIX}")))
+    else:
+        paths = [path]
+    manifests = []
+    for manifest_path in paths:
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            manifests.append(json.load(manifest_file))
+    return manifests
+
+
+def merge_manifests(manifests: List[Dict], expected_count: Optional[int] = None) -> Dict:
+    """
+    Combine per-shard manifests into one report
+
+    Shards run concurrently, so the run's wall time is that of the slowest
+    shard. Missing shards, and books reported by more than one manifest,
+    are listed rather than hidden.
+
+    Args:
+        manifests: Shard manifests, as written by write_manifest
+        expected_count: Number of shards the run was split into (defaults to
+            the count recorded in the manifests)
+
+    Raises:
+        ValueError: If there are no manifests or they disagree on the shard count
+    """
+    if not manifests:
+        raise ValueError("No shard manifests found")
+    counts = {manifest['shard_count'] for manifest in manifests}
+    if expected_count is not None:
+        counts.add(expected_count)
+    if len(counts) != 1:
+        raise ValueError(f"Manifests come from runs with different shard counts: {sorted(counts)}")
+    count = counts.pop()
+
+    by_shard = {}
+    for manifest in manifests:
+        # Keep the latest manifest if a shard was run more than once
+        current = by_shard.get(manifest['shard'])
+        if current is None or manifest['finished'] >= current['finished']:
+            by_shard[manifest['shard']] = manifest
+
+    files = {}
+    duplicates = []
+    for shard, manifest in sorted(by_shard.items()):
+        for entry in manifest['files']:
+            if entry['key'] in files:
+                duplicates.append(entry['key'])
+            files[entry['key']] = dict(entry, shard=shard)
+
+    results = [JobResult(**{key: value for key, value in entry.items() if key in JobResult.__dataclass_fields__})
+               for entry in files.values()]
+    base = CostModel(**next(iter(by_shard.values()))['model'])
+    succeeded = [entry for entry in files.values() if entry['success']]
+    return {
+        'shard_count': count,
+        'shards': {shard: {'host': manifest['host'], 'files': len(manifest['files']),
+                           'wall_seconds': manifest['wall_seconds'], 'finished': manifest['finished']}
+                   for shard, manifest in sorted(by_shard.items())},
+        'missing_shards': [shard for shard in range(1, count + 1) if shard not in by_shard],
+        'scanned': max(manifest['scanned'] for manifest in by_shard.values()),
+        'converted': len(files),
+        'successful': len(succeeded),
+        'failed': sorted(entry['key'] for entry in files.values() if not entry['success']),
+        'duplicate_files': sorted(set(duplicates)),
+        'wall_seconds': max(manifest['wall_seconds'] for manifest in by_shard.values()),
+        'actual_seconds': sum(result.actual_seconds for result in results),
+        'predicted_seconds': sum(result.predicted_seconds for result in results),
+        'fitted_model': asdict(CostModel.fit(results, base)),
+        'files': [files[key] for key in sorted(files)],
+    }
+
+
+def write_merged_report(report: Dict, report_path: str):
+    """Write a merged shard report as JSON"""
+    with open(report_path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
@@ -0,0 +1,177 @@
+import hashlib
+import io
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image
+
+from mapped_io import open_buffer
+from readers import open_reader
+
+
+DEFAULT_SIZES = [300]
+INDEX_NAME = "index.json"
+
+
+def parse_sizes(value: str) -> List[int]:
+    """Parse thumbnail sizes given as '150+300' (or '150,300')"""
+    sizes = sorted({int(size) for size in value.replace(',', '+').split('+') if size.strip()})
+    if not sizes or any(size <= 0 for size in sizes):
+        raise ValueError(f"Invalid thumbnail sizes: {value}")
+    return sizes
+
+
+def make_thumbnails(data: bytes, sizes: List[int], image: Optional[Image.Image] = None,
+                    quality: int = 85) -> Dict[int, bytes]:
+    """
+    Create JPEG thumbnails of a page, bounded to each size on the longest side
+
+    Args:
+        data: Encoded page bytes
+        sizes: Longest-side sizes in pixels
+        image: Already decoded page, if the caller decoded it anyway
+        quality: JPEG quality of the thumbnails
+
+    Returns:
+        Mapping of size to JPEG bytes
+    """
+    largest = max(sizes)
+    if image is None:
+        image = Image.open(open_buffer(data))
+        # JPEG draft mode decodes at 1/2..1/8 scale, just large enough for the biggest thumbnail
+        image.draft('RGB', (largest, largest))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    thumbnails = {}
+    for size in sorted(sizes, reverse=True):
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, 'JPEG', quality=quality)
+        thumbnails[size] = buffer.getvalue()
+        # Downscale the next (smaller) size from this one rather than the full page
+        image = thumbnail
+    return thumbnails
+
+
+def file_hash(path: str) -> str:
+    """Content hash of a comic file (or of the file listing of an image folder)"""
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        for root, dirs, files in sorted(os.walk(path)):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                stat = os.stat(file_path)
+                digest.update(f"{os.path.relpath(file_path, path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        return digest.hexdigest()
+
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ThumbnailIndex:
+    """
+    Persistent thumbnail store keyed on file content hash
+
+    Thumbnails live in <index_dir>/<hash>/cover_<size>.jpg. The index also
+    remembers each path's size and mtime, so unchanged files are skipped
+    without being read, and renamed or copied files reuse existing thumbnails.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.index_path = os.path.join(index_dir, INDEX_NAME)
+        self.files = {}
+        self.thumbnails = {}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as index_file:
+                data = json.load(index_file)
+            self.files = data.get('files', {})
+            self.thumbnails = data.get('thumbnails', {})
+
+    def save(self):
+        """Write the index to disk"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as index_file:
+            json.dump({'files': self.files, 'thumbnails': self.thumbnails}, index_file, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def _hash_for(self, path: str) -> str:
+        """Content hash of a path, reusing the stored one if size and mtime are unchanged"""
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['hash']
+        digest = file_hash(path)
+        self.files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}
+        return digest
+
+    def thumbnail_paths(self, digest: str, sizes: List[int]) -> Dict[int, str]:
+        """Paths of the cover thumbnails of a book"""
+        return {size: os.path.join(self.index_dir, digest, f"cover_{size}.jpg") for size in sizes}
+
+    def update(self, path: str, sizes: List[int]) -> Optional[Dict[int, str]]:
+        """
+        Make sure cover thumbnails exist for a book
+
+        Args:
+            path: Comic file or image folder
+            sizes: Thumbnail sizes to provide
+
+        Returns:
+            Mapping of size to thumbnail path, or None if the thumbnails were already up to date
+        """
+        path = os.path.abspath(path)
+        digest = self._hash_for(path)
+        paths = self.thumbnail_paths(digest, sizes)
+        entry = self.thumbnails.get(digest)
+        if entry and set(sizes) <= set(entry['sizes']) and all(os.path.isfile(p) for p in paths.values()):
+            return None
+
+        with open_reader(path) as reader:
+            cover = next(iter(reader.iter_pages()), None)
+        if cover is None:
+            raise ValueError(f"No pages found in {path}")
+
+        os.makedirs(os.path.join(self.index_dir, digest), exist_ok=True)
+        for size, data in make_thumbnails(cover.data, sizes).items():
+            with open(paths[size], 'wb') as thumbnail_file:
+                thumbnail_file.write(data)
+
+        known_sizes = set(entry['sizes']) if entry else set()
+        self.thumbnails[digest] = {'source': path, 'sizes': sorted(known_sizes | set(sizes))}
+        return paths
+
+
+def update_thumbnail_index(file_paths: List[str], index_dir: str, sizes: List[int],
+                           update_progress: Optional[Callable[[str], None]] = None) -> Dict[str, int]:
+    """
+    Generate cover thumbnails for many books, skipping ones already indexed
+
+    Returns:
+        Counts of 'generated', 'unchanged' and 'failed' books
+    """
+    index = ThumbnailIndex(index_dir)
+    counts = {'generated': 0, 'unchanged': 0, 'failed': 0}
+    try:
+        for file_path in file_paths:
+            try:
+                if index.update(file_path, sizes) is None:
+                    counts['unchanged'] += 1
+                else:
+                    counts['generated'] += 1
+                    if update_progress:
+                        update_progress(f"Thumbnails created: {os.path.basename(file_path)}")
+            except Exception as e:
+                counts['failed'] += 1
+                if update_progress:
+                    update_progress(f"Error creating thumbnails for {os.path.basename(file_path)}: {str(e)}")
+    finally:
+        index.save()
+    return counts
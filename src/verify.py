@@ -0,0 +1,271 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from metadata import find_comicinfo, parse_comicinfo
+from mupdf_lock import MUPDF_LOCK
+from page_order import build_page_index, is_image_name, order_page_names
+from readers import open_reader
+from scheduler import count_pages
+
+
+# Output extensions that can be verified (image folders are verified too)
+VERIFIABLE_EXTENSIONS = ('.cbz', '.pdf', '.epub')
+
+# Markers that complete image files end with; a missing marker means truncated data
+IMAGE_TRAILERS = {
+    'JPEG': b'\xff\xd9',
+    'PNG': b'IEND\xaeB`\x82',
+}
+
+
+@dataclass
+class VerifyResult:
+    """Outcome of verifying one output"""
+    path: str
+    format_name: str
+    pages: int = 0
+    expected_pages: Optional[int] = None
+    problems: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def check_image(data: bytes, name: str) -> Optional[str]:
+    """
+    Check that image data has a valid header and is not truncated
+
+    Only the header is parsed (Pillow opens images lazily) and the end
+    marker looked up, so no pixels are decoded.
+
+    Returns:
+        Description of the problem, or None if the image looks sound
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            image_format, (width, height) = img.format, img.size
+    except Exception as e:
+        return f"{name}: unreadable image header ({str(e)})"
+    if width <= 0 or height <= 0:
+        return f"{name}: invalid image dimensions {width}x{height}"
+    trailer = IMAGE_TRAILERS.get(image_format)
+    if trailer is not None and trailer not in data[-64:]:
+        return f"{name}: truncated {image_format} data"
+    return None
+
+
+def _check_zip_members(archive: zipfile.ZipFile, result: VerifyResult, image_names: List[str]):
+    """Read every member so zipfile checks its CRC, checking image headers on the way"""
+    images = set(image_names)
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        try:
+            data = archive.read(info)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            result.problems.append(f"{info.filename}: {str(e)}")
+            continue
+        if info.filename in images:
+            problem = check_image(data, info.filename)
+            if problem:
+                result.problems.append(problem)
+
+
+def verify_cbz(path: str) -> VerifyResult:
+    """Verify a CBZ: member CRCs, page headers and the ComicInfo page count"""
+    result = VerifyResult(path, "CBZ")
+    with zipfile.ZipFile(path, 'r') as archive:
+        pages = [info.filename for info in build_page_index(archive)]
+        result.pages = len(pages)
+        _check_zip_members(archive, result, pages)
+        member = find_comicinfo(archive)
+        if member is not None:
+            page_count = parse_comicinfo(archive.read(member)).get('PageCount')
+            if page_count and page_count.isdigit() and int(page_count) != result.pages:
+                result.problems.append(f"ComicInfo PageCount is {page_count} but the archive has "
+                                       f"{result.pages} pages")
+    return result
+
+
+def verify_epub(path: str) -> VerifyResult:
+    """Verify an EPUB: mimetype entry, member CRCs and image headers"""
+    result = VerifyResult(path, "EPUB")
+    with zipfile.ZipFile(path, 'r') as archive:
+        names = archive.namelist()
+        if not names or names[0] != 'mimetype' or archive.getinfo('mimetype').compress_type != zipfile.ZIP_STORED:
+            result.problems.append("mimetype must be the first entry, stored uncompressed")
+        result.pages = sum(1 for name in names if name.startswith('OEBPS/pages/') and name.endswith('.xhtml'))
+        _check_zip_members(archive, result, [name for name in names
+                                             if name.startswith('OEBPS/images/') and is_image_name(name)])
+    return result
+
+
+def verify_pdf(path: str) -> VerifyResult:
+    """
+    Verify a PDF: xref table, every object, and each image's header
+
+    JPEG images are embedded as-is, so their header and end marker are
+    checked against the dimensions in the image dictionary. MuPDF is held
+    for the whole check (see mupdf_lock).
+    """
+    result = VerifyResult(path, "PDF")
+    with MUPDF_LOCK:
+        document = fitz.open(path)
+        try:
+            if document.is_repaired:
+                result.problems.append("xref table is damaged (MuPDF had to repair it)")
+            for xref in range(1, document.xref_length()):
+                try:
+                    document.xref_object(xref, compressed=True)
+                except Exception as e:
+                    result.problems.append(f"object {xref}: {str(e)}")
+
+            result.pages = document.page_count
+            seen = set()
+            for page_index in range(document.page_count):
+                images = document.get_page_images(page_index, full=True)
+                if not images:
+                    result.problems.append(f"page {page_index + 1}: no image")
+                for image in images:
+                    xref, width, height, image_filter = image[0], image[2], image[3], image[8]
+                    if xref in seen:
+                        continue
+                    seen.add(xref)
+                    if width <= 0 or height <= 0:
+                        result.problems.append(f"image {xref}: invalid dimensions {width}x{height}")
+                    elif image_filter == 'DCTDecode':
+                        data = document.xref_stream_raw(xref)
+                        problem = check_image(data, f"image {xref}")
+                        if problem is None:
+                            with Image.open(io.BytesIO(data)) as img:
+                                if img.size != (width, height):
+                                    problem = (f"image {xref}: JPEG is {img.width}x{img.height} but the PDF "
+                                               f"declares {width}x{height}")
+                        if problem:
+                            result.problems.append(problem)
+        finally:
+            document.close()
+    return result
+
+
+def verify_image_folder(path: str) -> VerifyResult:
+    """Verify an image folder output: every page's header"""
+    result = VerifyResult(path, "Image folder")
+    pages = order_page_names(os.listdir(path))
+    result.pages = len(pages)
+    for name in pages:
+        with open(os.path.join(path, name), 'rb') as image_file:
+            problem = check_image(image_file.read(), name)
+        if problem:
+            result.problems.append(problem)
+    return result
+
+
+VERIFIERS: Dict[str, Callable[[str], VerifyResult]] = {
+    '.cbz': verify_cbz,
+    '.epub': verify_epub,
+    '.pdf': verify_pdf,
+}
+
+
+def verify_output(path: str, expected_pages: Optional[int] = None) -> VerifyResult:
+    """
+    Verify one output file or image folder
+
+    Args:
+        path: Output to verify
+        expected_pages: Number of pages the output should have (e.g. the source's page count)
+
+    Returns:
+        VerifyResult listing any problems found
+    """
+    extension = os.path.splitext(path)[1].lower()
+    verifier = verify_image_folder if os.path.isdir(path) else VERIFIERS.get(extension)
+    if verifier is None:
+        return VerifyResult(path, extension.lstrip('.').upper(), problems=[f"Cannot verify {extension} files"])
+    try:
+        result = verifier(path)
+    except Exception as e:
+        result = VerifyResult(path, extension.lstrip('.').upper() or "Image folder",
+                              problems=[f"Unreadable: {str(e)}"])
+    result.expected_pages = expected_pages
+    if expected_pages is not None and result.pages != expected_pages:
+        result.problems.append(f"Has {result.pages} pages, expected {expected_pages}")
+    return result
+
+
+def find_outputs(directory: str) -> List[str]:
+    """Outputs in a directory that can be verified (comic files and image folders)"""
+    outputs = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.path.splitext(name)[1].lower() in VERIFIABLE_EXTENSIONS:
+            outputs.append(path)
+        elif (os.path.isdir(path) and not name.endswith('_thumbnails')
+              and any(is_image_name(entry) for entry in os.listdir(path))):
+            outputs.append(path)
+    return outputs
+
+
+def _book_name(path: str) -> str:
+    path = os.path.normpath(path)
+    return os.path.basename(path) if os.path.isdir(path) else os.path.splitext(os.path.basename(path))[0]
+
+
+def expected_page_counts(output_paths: List[str], source_paths: List[str]) -> Dict[str, int]:
+    """
+    Page counts of the sources that outputs were converted from, matched by book name
+
+    Counts come from container metadata where possible (zip directory, PDF
+    page tree); other archives are opened to list their pages. Outputs
+    without a matching source (e.g. written with a profile suffix) are left out.
+    """
+    sources = {_book_name(path): path for path in source_paths}
+    counts = {}
+    for output_path in output_paths:
+        source_path = sources.get(_book_name(output_path))
+        if source_path is None:
+            continue
+        pages = count_pages(source_path)
+        if pages is None:
+            with open_reader(source_path) as reader:
+                pages = reader.page_count()
+        counts[output_path] = pages
+    return counts
+
+
+def verify_outputs(paths: List[str], expected_pages: Optional[Dict[str, int]] = None,
+                   jobs: Optional[int] = None,
+                   update_progress: Optional[Callable[[VerifyResult], None]] = None) -> List[VerifyResult]:
+    """
+    Verify many outputs in parallel
+
+    Each output is verified in a worker process: within a process, MuPDF
+    calls are serialized behind MUPDF_LOCK (see mupdf_lock), and CRC checks
+    and header parsing scale with processes up to the speed of the disk.
+
+    Args:
+        paths: Outputs to verify
+        expected_pages: Expected page count per output path, where known
+        jobs: Number of worker processes (defaults to the CPU count)
+        update_progress: Called with each result as it completes, in order
+
+    Returns:
+        Results in the order of paths
+    """
+    expected_pages = expected_pages or {}
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(verify_output, paths, [expected_pages.get(path) for path in paths]):
+            results.append(result)
+            if update_progress:
+                update_progress(result)
+    return results
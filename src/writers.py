@@ -0,0 +1,560 @@
+import fitz  # PyMuPDF
+import hashlib
+import io
+import os
+import shutil
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Dict, List, Optional, Type, Union
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+from mapped_io import open_buffer
+from metadata import COMICINFO_NAME, parse_comicinfo, comicinfo_to_pdf
+from mupdf_lock import MUPDF_LOCK
+from readers import Page
+from thumbnails import DEFAULT_SIZES, make_thumbnails, parse_sizes
+
+
+class ComicWriter:
+    """
+    Base class for output formats
+
+    Writers receive pages one at a time through add_page(), in reading order,
+    so a single extraction pass can feed several writers at once. Subclasses
+    register themselves for an output type with @register_writer.
+
+    Single-file writers also accept a writable binary stream instead of a
+    path. The stream doesn't need to be seekable, so pipes work too.
+    """
+    format_name = ""
+    output_type = ""
+    extension = ""
+    # Writer-specific options accepted from output profiles (name -> type)
+    options = {}
+    # Whether the output is a single file that can be written to a stream
+    streamable = True
+
+    def __init__(self, output_path: Union[str, BinaryIO], update_progress: Callable[[str], None]):
+        if not isinstance(output_path, str) and not self.streamable:
+            raise ValueError(f"{self.format_name} output can't be written to a stream")
+        self.output_path = output_path
+        self.update_progress = update_progress
+        self.page_count = 0
+
+    @property
+    def destination(self) -> str:
+        """Output path, or a description of the output stream, for messages"""
+        if isinstance(self.output_path, str):
+            return self.output_path
+        return str(getattr(self.output_path, 'name', 'stream'))
+
+    def add_page(self, page: Page):
+        """Append a page to the output"""
+        raise NotImplementedError
+
+    def set_comicinfo(self, comicinfo_data: bytes):
+        """Attach ComicInfo.xml metadata to the output (called before close)"""
+        pass
+
+    def close(self) -> bool:
+        """Finalize the output; returns True if successful"""
+        raise NotImplementedError
+
+    def abort(self):
+        """Discard a partially written output (a stream is left as it is)"""
+        if isinstance(self.output_path, str) and os.path.isfile(self.output_path):
+            os.remove(self.output_path)
+
+
+WRITERS: Dict[str, Type[ComicWriter]] = {}
+
+
+def register_writer(writer_class: Type[ComicWriter]) -> Type[ComicWriter]:
+    """Class decorator registering a writer for its output type"""
+    WRITERS[writer_class.output_type] = writer_class
+    return writer_class
+
+
+def parse_output_types(output_type) -> List[str]:
+    """
+    Normalize an output type specification
+
+    Args:
+        output_type: A single type ('cbz'), a comma-separated list ('cbz,pdf') or a list
+
+    Returns:
+        List of unique, lower-case output types in the given order
+
+    Raises:
+        ValueError: If an output type has no registered writer
+    """
+    if isinstance(output_type, str):
+        output_type = output_type.split(',')
+    output_types = []
+    for name in output_type:
+        name = name.strip().lower()
+        if not name or name in output_types:
+            continue
+        if name not in WRITERS:
+            raise ValueError(f"Unsupported output type: {name}")
+        output_types.append(name)
+    if not output_types:
+        raise ValueError("No output type given")
+    return output_types
+
+
+def output_path_for(output_dir: str, basename: str, output_type: str) -> str:
+    """Output path for a book in the given output type"""
+    writer_class = WRITERS[output_type]
+    return os.path.join(output_dir, f"{basename}{writer_class.extension}")
+
+
+def open_writer(output_type: str, output_dir: str, basename: str,
+                update_progress: Callable[[str], None], **options) -> ComicWriter:
+    """Create the registered writer for an output type, passing writer-specific options"""
+    writer_class = WRITERS[output_type]
+    return writer_class(output_path_for(output_dir, basename, output_type), update_progress, **options)
+
+
+def open_stream_writer(output_type: str, stream: BinaryIO, update_progress: Callable[[str], None],
+                       **options) -> ComicWriter:
+    """
+    Create the registered writer for an output type, writing to a binary stream
+
+    Raises:
+        ValueError: If the output type is not a single file (e.g. 'images')
+    """
+    writer_class = WRITERS[output_type]
+    return writer_class(stream, update_progress, **options)
+
+
+def _page_file_name(page: Page) -> str:
+    """Sequential file name for a page (000.jpeg, 001.png, ...)"""
+    extension = page.extension or 'jpeg'
+    return f"{page.index:03d}.{extension}"
+
+
+# Source formats that are lossy anyway, so re-encoding them as JPEG loses little
+LOSSY_EXTENSIONS = ('jpx', 'jp2', 'j2k', 'jpf')
+
+
+def reencode_page(page: Page, image: Optional[Image.Image] = None) -> Page:
+    """
+    Re-encode a page in a widely supported format: JPEG for lossy sources (e.g.
+    JPEG 2000 from a PDF), PNG for everything else
+
+    Args:
+        page: Page whose format readers or viewers don't accept
+        image: The page already decoded, if available
+
+    Returns:
+        The page, numbered as before, with new data and extension
+    """
+    if image is None:
+        image = Image.open(open_buffer(page.data))
+    buffer = io.BytesIO()
+    if page.extension in LOSSY_EXTENSIONS:
+        extension = 'jpeg'
+        image.convert('RGB' if image.mode not in ('RGB', 'L') else image.mode).save(buffer, 'JPEG', quality=95)
+    else:
+        extension = 'png'
+        image.convert('RGB' if image.mode == 'CMYK' else image.mode).save(buffer, 'PNG')
+    return Page(page.index, f"{page.index:03d}.{extension}", buffer.getvalue(), page.image)
+
+
+def _image_size(data):
+    """Read image dimensions from the header without decoding pixels"""
+    with Image.open(open_buffer(data)) as img:
+        return img.size
+
+
+@register_writer
+class CbzWriter(ComicWriter):
+    """Writes pages into a zip archive"""
+    format_name = "CBZ"
+    output_type = "cbz"
+    extension = ".cbz"
+
+    def __init__(self, output_path: Union[str, BinaryIO], update_progress: Callable[[str], None]):
+        super().__init__(output_path, update_progress)
+        # On a non-seekable stream zipfile writes data descriptors after each member
+        self.archive = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED)
+
+    def add_page(self, page: Page):
+        self.archive.writestr(_page_file_name(page), page.data)
+        self.page_count += 1
+
+    def set_comicinfo(self, comicinfo_data: bytes):
+        self.archive.writestr(COMICINFO_NAME, comicinfo_data)
+
+    def close(self) -> bool:
+        self.archive.close()
+        self.update_progress(f"CBZ archive created: {self.destination}")
+        return True
+
+    def abort(self):
+        self.archive.close()
+        super().abort()
+
+
+# PyMuPDF save options for each PDF writer profile
+PDF_SAVE_PROFILES = {
+    # Smallest file: drop unused/duplicate objects, deflate all streams, pack objects
+    'size': dict(garbage=4, clean=True, deflate=True, deflate_images=True, deflate_fonts=True,
+                 use_objstms=1),
+    # Fastest save: write objects as they are
+    'fast': dict(garbage=0, deflate=False),
+}
+
+
+def pdf_save_profile(value: str) -> str:
+    """Validate a PDF save profile name"""
+    if value == 'linearized':
+        # MuPDF 1.26 (the oldest release this project supports) rejects linear=True
+        raise ValueError("Linearized PDFs are not available: MuPDF no longer supports linearization")
+    if value not in PDF_SAVE_PROFILES:
+        raise ValueError(f"Unknown PDF save profile: {value} (choose from {', '.join(PDF_SAVE_PROFILES)})")
+    return value
+
+
+@register_writer
+class PdfWriter(ComicWriter):
+    """
+    Writes one page per image into a PDF document
+
+    Identical page images are embedded once and referenced from every page
+    that shows them. The save profile selects PyMuPDF save options.
+    """
+    format_name = "PDF"
+    output_type = "pdf"
+    extension = ".pdf"
+    options = {'save': pdf_save_profile}
+
+    def __init__(self, output_path: Union[str, BinaryIO], update_progress: Callable[[str], None],
+                 save: str = 'size'):
+        super().__init__(output_path, update_progress)
+        self.save_profile = pdf_save_profile(save)
+        with MUPDF_LOCK:
+            self.document = fitz.open()
+        self.image_xrefs = {}
+
+    def add_page(self, page: Page):
+        try:
+            img_width, img_height = _image_size(page.data)
+
+            page_width = img_width * 72 / 96
+            page_height = img_height * 72 / 96
+
+            rect = fitz.Rect(0, 0, page_width, page_height)
+            digest = hashlib.sha1(page.data).digest()
+            with MUPDF_LOCK:
+                pdf_page = self.document.new_page(width=page_width, height=page_height)
+                if digest in self.image_xrefs:
+                    pdf_page.insert_image(rect, xref=self.image_xrefs[digest])
+                else:
+                    # MuPDF copies the image either way, but only accepts bytes
+                    self.image_xrefs[digest] = pdf_page.insert_image(rect, stream=bytes(page.data))
+            self.page_count += 1
+
+        except Exception as e:
+            self.update_progress(f"Error adding image {page.name} to PDF: {str(e)}")
+
+    def set_comicinfo(self, comicinfo_data: bytes):
+        metadata, toc = comicinfo_to_pdf(parse_comicinfo(comicinfo_data))
+        with MUPDF_LOCK:
+            if metadata:
+                self.document.set_metadata(metadata)
+            toc = [entry for entry in toc if entry[2] <= len(self.document)]
+            if toc:
+                self.document.set_toc(toc)
+
+    def _write(self, options: Dict):
+        if isinstance(self.output_path, str):
+            with MUPDF_LOCK:
+                self.document.save(self.output_path, **options)
+        else:
+            # The document is built in memory anyway, so serialize it and write it out in one go
+            with MUPDF_LOCK:
+                data = self.document.tobytes(**options)
+            self.output_path.write(data)
+
+    def close(self) -> bool:
+        if self.page_count == 0:
+            with MUPDF_LOCK:
+                self.document.close()
+            self.update_progress("No images found for PDF creation")
+            return False
+        self._write(PDF_SAVE_PROFILES[self.save_profile])
+        with MUPDF_LOCK:
+            self.document.close()
+        self.update_progress(f"PDF document created: {self.destination}")
+        return True
+
+    def abort(self):
+        with MUPDF_LOCK:
+            self.document.close()
+        super().abort()
+
+
+@register_writer
+class ImageDirWriter(ComicWriter):
+    """Dumps pages as plain image files into a directory named after the book"""
+    format_name = "Image folder"
+    output_type = "images"
+    extension = ""
+    streamable = False
+
+    def __init__(self, output_path: str, update_progress: Callable[[str], None]):
+        super().__init__(output_path, update_progress)
+        os.makedirs(output_path, exist_ok=True)
+        self.written = []
+
+    def add_page(self, page: Page):
+        file_path = os.path.join(self.output_path, _page_file_name(page))
+        with open(file_path, "wb") as image_file:
+            image_file.write(page.data)
+        self.written.append(file_path)
+        self.page_count += 1
+
+    def set_comicinfo(self, comicinfo_data: bytes):
+        file_path = os.path.join(self.output_path, COMICINFO_NAME)
+        with open(file_path, "wb") as comicinfo_file:
+            comicinfo_file.write(comicinfo_data)
+        self.written.append(file_path)
+
+    def close(self) -> bool:
+        self.update_progress(f"Images written to: {self.output_path}")
+        return True
+
+    def abort(self):
+        for file_path in self.written:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+        if os.path.isdir(self.output_path) and not os.listdir(self.output_path):
+            shutil.rmtree(self.output_path)
+
+
+def thumbnail_pages(value: str) -> str:
+    """Validate which pages get thumbnails"""
+    if value not in ('cover', 'all'):
+        raise ValueError(f"Unknown thumbnail pages setting: {value} (choose from cover, all)")
+    return value
+
+
+@register_writer
+class ThumbnailWriter(ImageDirWriter):
+    """
+    Writes JPEG thumbnails of the cover (or every page) as a conversion by-product
+
+    Thumbnails are made from the page the conversion already decoded when
+    there is one, and from a JPEG draft-mode decode otherwise.
+    """
+    format_name = "Thumbnails"
+    output_type = "thumbnails"
+    extension = "_thumbnails"
+    options = {'sizes': parse_sizes, 'pages': thumbnail_pages}
+
+    def __init__(self, output_path: str, update_progress: Callable[[str], None],
+                 sizes: List[int] = None, pages: str = 'cover'):
+        super().__init__(output_path, update_progress)
+        self.sizes = sizes or DEFAULT_SIZES
+        self.pages = thumbnail_pages(pages)
+
+    def add_page(self, page: Page):
+        if self.pages == 'cover' and page.index > 0:
+            return
+        name = "cover" if page.index == 0 else f"{page.index:03d}"
+        try:
+            thumbnails = make_thumbnails(page.data, self.sizes, page.image)
+        except Exception as e:
+            self.update_progress(f"Error creating thumbnail for {page.name}: {str(e)}")
+            return
+        for size, data in thumbnails.items():
+            file_path = os.path.join(self.output_path, f"{name}_{size}.jpg")
+            with open(file_path, "wb") as thumbnail_file:
+                thumbnail_file.write(data)
+            self.written.append(file_path)
+        self.page_count += 1
+
+    def set_comicinfo(self, comicinfo_data: bytes):
+        pass
+
+    def close(self) -> bool:
+        self.update_progress(f"Thumbnails written to: {self.output_path}")
+        return self.page_count > 0
+
+
+EPUB_MEDIA_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+
+@register_writer
+class EpubWriter(ComicWriter):
+    """
+    Writes a fixed-layout EPUB 3 with one image per page
+
+    Images and page documents are streamed into the archive as pages arrive;
+    only the package document and navigation, which list every page, are
+    written at close.
+    """
+    format_name = "EPUB"
+    output_type = "epub"
+    extension = ".epub"
+
+    def __init__(self, output_path: Union[str, BinaryIO], update_progress: Callable[[str], None]):
+        super().__init__(output_path, update_progress)
+        self.archive = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED)
+        # The mimetype entry must come first and be stored uncompressed
+        self.archive.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        self.archive.writestr('META-INF/container.xml',
+                              '<?xml version="1.0" encoding="UTF-8"?>\n'
+                              '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                              '  <rootfiles>\n'
+                              '    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>\n'
+                              '  </rootfiles>\n'
+                              '</container>\n')
+        self.pages = []
+        self.image_names = {}
+        self.comicinfo = {}
+
+    def add_page(self, page: Page):
+        if (page.extension or 'jpeg') not in EPUB_MEDIA_TYPES:
+            # Not an EPUB core media type (e.g. BMP, JPEG 2000): convert rather than lose the page
+            page = reencode_page(page, page.image)
+        extension = page.extension or 'jpeg'
+        width, height = _image_size(page.data)
+        number = len(self.pages)
+        page_name = f"pages/{number:03d}.xhtml"
+
+        # Identical images are stored once and referenced from every page showing them
+        digest = hashlib.sha1(page.data).digest()
+        image_name = self.image_names.get(digest)
+        if image_name is None:
+            image_name = f"images/{number:03d}.{extension}"
+            self.archive.writestr(f"OEBPS/{image_name}", page.data)
+            self.image_names[digest] = image_name
+        self.archive.writestr(f"OEBPS/{page_name}",
+                              '<?xml version="1.0" encoding="UTF-8"?>\n'
+                              '<!DOCTYPE html>\n'
+                              '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+                              '<head>\n'
+                              f'  <title>Page {number + 1}</title>\n'
+                              f'  <meta name="viewport" content="width={width}, height={height}"/>\n'
+                              '  <style>html, body { margin: 0; padding: 0; } '
+                              'img { display: block; width: 100%; height: 100%; }</style>\n'
+                              '</head>\n'
+                              '<body>\n'
+                              f'  <img src="../{image_name}" alt="Page {number + 1}"/>\n'
+                              '</body>\n'
+                              '</html>\n')
+        self.pages.append((image_name, page_name, EPUB_MEDIA_TYPES[extension], width, height))
+        self.page_count += 1
+
+    def set_comicinfo(self, comicinfo_data: bytes):
+        self.comicinfo = parse_comicinfo(comicinfo_data)
+
+    def _title(self) -> str:
+        title = self.comicinfo.get('Title') or self.comicinfo.get('Series')
+        if title:
+            return title
+        return os.path.splitext(os.path.basename(self.destination))[0]
+
+    def _package_document(self) -> str:
+        modified = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        language = self.comicinfo.get('LanguageISO') or 'en'
+        rtl = self.comicinfo.get('Manga') == 'YesAndRightToLeft'
+        width, height = self.pages[0][3], self.pages[0][4]
+
+        metadata = [
+            f'    <dc:identifier id="book-id">urn:uuid:{uuid.uuid4()}</dc:identifier>',
+            f'    <dc:title>{escape(self._title())}</dc:title>',
+            f'    <dc:language>{escape(language)}</dc:language>',
+            f'    <meta property="dcterms:modified">{modified}</meta>',
+            '    <meta property="rendition:layout">pre-paginated</meta>',
+            '    <meta property="rendition:spread">landscape</meta>',
+            f'    <meta name="original-resolution" content="{width}x{height}"/>',
+            '    <meta name="fixed-layout" content="true"/>',
+        ]
+        if self.comicinfo.get('Writer'):
+            metadata.append(f'    <dc:creator>{escape(self.comicinfo["Writer"])}</dc:creator>')
+        if self.comicinfo.get('Publisher'):
+            metadata.append(f'    <dc:publisher>{escape(self.comicinfo["Publisher"])}</dc:publisher>')
+        if self.comicinfo.get('Summary'):
+            metadata.append(f'    <dc:description>{escape(self.comicinfo["Summary"])}</dc:description>')
+
+        manifest = ['    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        spine = []
+        listed_images = set()
+        for number, (image_name, page_name, media_type, _, _) in enumerate(self.pages):
+            if image_name not in listed_images:
+                listed_images.add(image_name)
+                cover = ' properties="cover-image"' if number == 0 else ''
+                manifest.append(f'    <item id="img{number:03d}" href="{image_name}" '
+                                f'media-type="{media_type}"{cover}/>')
+            manifest.append(f'    <item id="page{number:03d}" href="{page_name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'    <itemref idref="page{number:03d}"/>')
+
+        direction = ' page-progression-direction="rtl"' if rtl else ''
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" '
+                'prefix="rendition: http://www.idpf.org/vocab/rendition/#">\n'
+                '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+                + '\n'.join(metadata) + '\n'
+                '  </metadata>\n'
+                '  <manifest>\n'
+                + '\n'.join(manifest) + '\n'
+                '  </manifest>\n'
+                f'  <spine{direction}>\n'
+                + '\n'.join(spine) + '\n'
+                '  </spine>\n'
+                '</package>\n')
+
+    def _navigation_document(self) -> str:
+        entries = []
+        for bookmark in self.comicinfo.get('Pages', []):
+            try:
+                number = int(bookmark.get('Image', ''))
+            except ValueError:
+                continue
+            if bookmark.get('Bookmark') and 0 <= number < len(self.pages):
+                entries.append((number, bookmark['Bookmark']))
+        if not entries:
+            entries = [(0, self._title())]
+
+        items = '\n'.join(f'      <li><a href="{self.pages[number][1]}">{escape(title)}</a></li>'
+                          for number, title in sorted(entries))
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<!DOCTYPE html>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+                f'<head><title>{escape(self._title())}</title></head>\n'
+                '<body>\n'
+                '  <nav epub:type="toc">\n'
+                '    <ol>\n'
+                f'{items}\n'
+                '    </ol>\n'
+                '  </nav>\n'
+                '</body>\n'
+                '</html>\n')
+
+    def close(self) -> bool:
+        if not self.pages:
+            self.abort()
+            self.update_progress("No images found for EPUB creation")
+            return False
+        self.archive.writestr('OEBPS/content.opf', self._package_document())
+        self.archive.writestr('OEBPS/nav.xhtml', self._navigation_document())
+        self.archive.close()
+        self.update_progress(f"EPUB created: {self.destination}")
+        return True
+
+    def abort(self):
+        self.archive.close()
+        super().abort()
@@ -0,0 +1,145 @@
+import io
+import os
+import stat
+import zipfile
+
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image, ImageDraw
+
+from converter import convert_single_file
+from metadata import build_comicinfo, check_field_name, parse_comicinfo, remap_pages, update_cbz_metadata
+from profiles import parse_profile
+
+
+def _jpeg(width: int, height: int, color) -> bytes:
+    image = Image.new('RGB', (width, height), color)
+    ImageDraw.Draw(image).rectangle([5, 5, width - 6, height - 6], outline=(0, 0, 0), width=3)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def _output_bookmarks(cbz_path):
+    with zipfile.ZipFile(cbz_path) as archive:
+        pages = parse_comicinfo(archive.read('ComicInfo.xml')).get('Pages', [])
+    return {page['Bookmark']: int(page['Image']) for page in pages}
+
+
+def test_remap_pages():
+    pages = [{'Image': '0', 'Type': 'FrontCover'}, {'Image': '1'}, {'Image': '2', 'Bookmark': 'End'},
+             {'Image': 'x'}]
+    assert remap_pages(pages, {0: 0, 2: 1}) == [{'Image': '0', 'Type': 'FrontCover'},
+                                                {'Image': '1', 'Bookmark': 'End'}]
+
+
+def test_split_spreads_renumber_bookmarks(tmp_path):
+    document = fitz.open()
+    for width, color in [(300, (200, 0, 0)), (600, (0, 200, 0)), (300, (0, 0, 200))]:
+        page = document.new_page(width=width, height=400)
+        page.insert_image(page.rect, stream=_jpeg(width, 400, color))
+    document.set_toc([[1, 'Cover', 1], [1, 'Spread', 2], [1, 'End', 3]])
+    source = tmp_path / 'book.pdf'
+    document.save(source)
+    document.close()
+
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    profiles = [parse_profile(spec) for spec in ('pdf:split=1', 'cbz:split=1', 'cbz:suffix=_whole')]
+    assert convert_single_file(str(source), str(output_dir), profiles)
+
+    with fitz.open(output_dir / 'book.pdf') as output:
+        assert output.page_count == 4
+        assert output.get_toc() == [[1, 'Cover', 1], [1, 'Spread', 2], [1, 'End', 4]]
+    assert _output_bookmarks(output_dir / 'book.cbz') == {'Cover': 0, 'Spread': 1, 'End': 3}
+    assert _output_bookmarks(output_dir / 'book_whole.cbz') == {'Cover': 0, 'Spread': 1, 'End': 2}
+
+
+def test_removed_duplicates_drop_and_renumber_bookmarks(tmp_path):
+    red = _jpeg(300, 400, (200, 0, 0))
+    image = Image.new('RGB', (300, 400), (255, 255, 255))
+    ImageDraw.Draw(image).polygon([(0, 0), (300, 0), (0, 400)], fill=(0, 0, 200))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    blue = buffer.getvalue()
+    source = tmp_path / 'book.cbz'
+    with zipfile.ZipFile(source, 'w') as archive:
+        for name, data in [('1.jpg', red), ('2.jpg', red), ('3.jpg', blue)]:
+            archive.writestr(name, data)
+        archive.writestr('ComicInfo.xml', build_comicinfo({'Pages': [
+            {'Image': '0', 'Bookmark': 'Cover'}, {'Image': '1', 'Bookmark': 'Again'},
+            {'Image': '2', 'Bookmark': 'End'}]}))
+
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    assert convert_single_file(str(source), str(output_dir), 'cbz', dedupe='remove')
+    assert _output_bookmarks(output_dir / 'book.cbz') == {'Cover': 0, 'End': 1}
+
+
+def _cbz_with_comicinfo(path, position):
+    """CBZ with ComicInfo.xml first, last or absent (position None)"""
+    comicinfo = build_comicinfo({'Title': 'Old', 'Series': 'Series'})
+    with zipfile.ZipFile(path, 'w') as archive:
+        if position == 'first':
+            archive.writestr('ComicInfo.xml', comicinfo)
+        for index in range(3):
+            archive.writestr(f'{index}.jpg', _jpeg(30, 40, (index * 80, 0, 0)))
+        if position == 'last':
+            archive.writestr('ComicInfo.xml', comicinfo)
+        archive.comment = b'comment'
+    os.chmod(path, 0o644)
+    return str(path)
+
+
+@pytest.mark.parametrize('position, message', [(None, 'in place'), ('last', 'in place'),
+                                               ('first', 'archive rewritten')])
+def test_retag(tmp_path, position, message):
+    path = _cbz_with_comicinfo(tmp_path / 'book.cbz', position)
+    with zipfile.ZipFile(path) as archive:
+        pages = {name: archive.read(name) for name in archive.namelist() if name.endswith('.jpg')}
+    messages = []
+    assert update_cbz_metadata(path, {'Title': 'Retagged'}, update_progress=messages.append)
+    assert message in messages[-1]
+
+    # mkstemp would make a rewritten archive private
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert archive.comment == b'comment'
+        assert {name: archive.read(name) for name in archive.namelist() if name.endswith('.jpg')} == pages
+        assert archive.namelist().count('ComicInfo.xml') == 1
+        info = parse_comicinfo(archive.read('ComicInfo.xml'))
+    assert info['Title'] == 'Retagged'
+    assert info.get('Series') == (None if position is None else 'Series')
+
+
+def test_retag_in_place_leaves_pages_untouched(tmp_path):
+    path = _cbz_with_comicinfo(tmp_path / 'book.cbz', 'last')
+    with zipfile.ZipFile(path) as archive:
+        comicinfo_offset = archive.getinfo('ComicInfo.xml').header_offset
+    with open(path, 'rb') as archive_file:
+        pages = archive_file.read(comicinfo_offset)
+    assert update_cbz_metadata(path, {'Title': 'Retagged'})
+    with open(path, 'rb') as archive_file:
+        assert archive_file.read(comicinfo_offset) == pages
+
+
+def test_retag_to_output_path(tmp_path):
+    path = _cbz_with_comicinfo(tmp_path / 'book.cbz', 'last')
+    output_path = tmp_path / 'retagged.cbz'
+    assert update_cbz_metadata(path, {'Title': 'Retagged'}, output_path=str(output_path))
+    with zipfile.ZipFile(path) as archive:
+        assert parse_comicinfo(archive.read('ComicInfo.xml'))['Title'] == 'Old'
+    with zipfile.ZipFile(output_path) as archive:
+        assert parse_comicinfo(archive.read('ComicInfo.xml'))['Title'] == 'Retagged'
+
+
+@pytest.mark.parametrize('field', ['A/B', 'Title[1]', '1st', 'ns:Title', '', 'Pages'])
+def test_check_field_name_rejects(field):
+    with pytest.raises(ValueError):
+        check_field_name(field)
+
+
+def test_check_field_name_accepts_custom_fields():
+    check_field_name('Title')
+    check_field_name('My_Field-2')
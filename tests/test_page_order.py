@@ -0,0 +1,40 @@
+import zipfile
+
+from page_order import get_page_index, natural_sort_key, order_page_names
+from readers import open_reader
+
+
+def test_numbers_sort_numerically():
+    assert order_page_names(['p10.jpg', 'p2.jpg', 'P1.jpg']) == ['P1.jpg', 'p2.jpg', 'p10.jpg']
+
+
+def test_digit_like_characters_are_text():
+    # '²' is a digit to str.isdigit() but not a number to int()
+    assert order_page_names(['x/²/1.jpg', 'x/a/1.jpg', 'x/2/1.jpg']) == ['x/2/1.jpg', 'x/a/1.jpg', 'x/²/1.jpg']
+    assert natural_sort_key('²') == ['²']
+
+
+def test_unicode_decimal_digits_are_numbers():
+    assert natural_sort_key('page١٠') == ['page', 10, '']
+
+
+def test_page_index_is_built_from_the_open_archive(tmp_path, monkeypatch):
+    path = tmp_path / 'book.cbz'
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name in ['p10.jpg', 'p2.jpg', 'ComicInfo.xml']:
+            archive.writestr(name, b'')
+
+    opened = []
+    real_zipfile = zipfile.ZipFile
+
+    def counting_zipfile(*args, **kwargs):
+        opened.append(args[0])
+        return real_zipfile(*args, **kwargs)
+
+    monkeypatch.setattr(zipfile, 'ZipFile', counting_zipfile)
+    with open_reader(str(path)) as reader:
+        assert reader.page_names == ['p2.jpg', 'p10.jpg']
+    assert len(opened) == 1
+    # A second conversion of the unchanged file is served from the cache
+    assert get_page_index(str(path)) == ['p2.jpg', 'p10.jpg']
+    assert len(opened) == 1
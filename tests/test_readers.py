@@ -0,0 +1,187 @@
+import io
+import shutil
+import subprocess
+import tarfile
+import zipfile
+
+import pytest
+from PIL import Image
+
+import readers
+from converter import convert_single_file
+from readers import (Cb7Reader, CbrReader, CbtReader, CbzReader, ImageFolderReader, PdfReader,
+                     get_reader_class, open_reader, supported_extensions)
+
+
+# Pages out of natural order, with a chapter folder and archiver junk mixed in
+PAGE_NAMES = ['page10.png', 'page2.png', 'page1.png', 'ch2/001.png', 'ch10/001.png']
+JUNK_NAMES = ['__MACOSX/._page1.png', '.hidden.png', 'Thumbs.db', 'notes.txt']
+READING_ORDER = ['page1.png', 'page2.png', 'page10.png', 'ch2/001.png', 'ch10/001.png']
+
+
+def make_page(name: str) -> bytes:
+    """Small PNG whose color is derived from its name, so pages can be told apart"""
+    shade = sum(name.encode()) % 256
+    buffer = io.BytesIO()
+    Image.new('RGB', (24, 32), (shade, 255 - shade, 0)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def archive_members():
+    """Member name to content of a test book, pages and junk"""
+    members = {name: make_page(name) for name in PAGE_NAMES}
+    members.update({name: b'junk' for name in JUNK_NAMES})
+    return members
+
+
+@pytest.fixture
+def cbz_path(tmp_path):
+    path = tmp_path / 'book.cbz'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in archive_members().items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def _page_names(path):
+    with open_reader(path) as reader:
+        pages = list(reader.iter_pages())
+        assert reader.page_count() == len(pages)
+    for page in pages:
+        assert bytes(page.data) == make_page(page.name)
+    return [page.name for page in pages]
+
+
+def _write_tar(path, mode):
+    with tarfile.open(path, mode) as archive:
+        for name, data in archive_members().items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_registry_maps_extensions_to_readers():
+    assert readers.READERS['.pdf'] is PdfReader
+    assert readers.READERS['.cbz'] is CbzReader
+    assert readers.READERS['.cbt'] is CbtReader
+    assert readers.READERS['.cb7'] is Cb7Reader
+    assert readers.READERS['.cbr'] is CbrReader
+    assert {'.pdf', '.cbz', '.cbt'} <= set(supported_extensions())
+
+
+def test_get_reader_class(tmp_path, cbz_path):
+    assert get_reader_class(cbz_path) is CbzReader
+    assert get_reader_class(str(tmp_path / 'book.txt')) is None
+
+    # CBR and CB7 files that are really zip archives are read as CBZ
+    mislabeled = tmp_path / 'zip.cbr'
+    shutil.copy(cbz_path, mislabeled)
+    assert get_reader_class(str(mislabeled)) is CbzReader
+
+    folder = tmp_path / 'folder'
+    folder.mkdir()
+    assert get_reader_class(str(folder)) is None
+    (folder / '001.png').write_bytes(make_page('001.png'))
+    assert get_reader_class(str(folder)) is ImageFolderReader
+
+
+def test_open_reader_rejects_unsupported_formats(tmp_path):
+    path = tmp_path / 'book.txt'
+    path.write_text('not a comic')
+    with pytest.raises(ValueError):
+        open_reader(str(path))
+    with pytest.raises(ValueError):
+        open_reader(b'not a comic')
+
+
+def test_cbz_page_order(cbz_path):
+    assert _page_names(cbz_path) == READING_ORDER
+
+
+def test_cbz_from_stream(cbz_path):
+    with open(cbz_path, 'rb') as source:
+        assert _page_names(source.read()) == READING_ORDER
+
+
+@pytest.mark.parametrize('mode', ['w', 'w:gz', 'w:bz2', 'w:xz'])
+def test_cbt_page_order(tmp_path, mode):
+    path = _write_tar(tmp_path / 'book.cbt', mode)
+    assert get_reader_class(path) is CbtReader
+    assert _page_names(path) == READING_ORDER
+
+
+def test_cbt_from_stream(tmp_path):
+    path = _write_tar(tmp_path / 'book.cbt', 'w:gz')
+    with open(path, 'rb') as source:
+        with open_reader(io.BytesIO(source.read())) as reader:
+            assert isinstance(reader, CbtReader)
+
+
+def test_image_folder_page_order(tmp_path):
+    folder = tmp_path / 'Book'
+    for name, data in archive_members().items():
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    assert _page_names(str(folder)) == READING_ORDER
+
+
+def test_cb7_page_order(tmp_path):
+    py7zr = pytest.importorskip('py7zr')
+    path = tmp_path / 'book.cb7'
+    with py7zr.SevenZipFile(path, 'w') as archive:
+        for name, data in archive_members().items():
+            archive.writestr(data, name)
+    assert get_reader_class(str(path)) is Cb7Reader
+    assert _page_names(str(path)) == READING_ORDER
+
+
+def test_cbr_page_order(tmp_path):
+    pytest.importorskip('rarfile')
+    rar = shutil.which('rar')
+    if rar is None:
+        pytest.skip("creating RAR archives needs the rar tool")
+    source = tmp_path / 'source'
+    for name, data in archive_members().items():
+        path = source / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    path = tmp_path / 'book.cbr'
+    subprocess.run([rar, 'a', '-r', '-idq', str(path), '.'], cwd=source, check=True)
+    assert get_reader_class(str(path)) is CbrReader
+    assert _page_names(str(path)) == READING_ORDER
+
+
+def _corrupt_member(path, name):
+    """Flip a byte in the middle of a member's data"""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name)
+    with open(path, 'r+b') as archive_file:
+        archive_file.seek(info.header_offset + 26)
+        name_length, extra_length = int.from_bytes(archive_file.read(2), 'little'), \
+            int.from_bytes(archive_file.read(2), 'little')
+        offset = info.header_offset + 30 + name_length + extra_length + info.compress_size // 2
+        archive_file.seek(offset)
+        value = archive_file.read(1)[0]
+        archive_file.seek(offset)
+        archive_file.write(bytes([value ^ 0xff]))
+
+
+def test_damaged_page_is_skipped(tmp_path, cbz_path):
+    _corrupt_member(cbz_path, 'page2.png')
+    with open_reader(cbz_path) as reader:
+        readable = []
+        for index, name, read in reader.iter_page_entries():
+            try:
+                readable.append(read().name)
+            except Exception:
+                pass
+    assert readable == [name for name in READING_ORDER if name != 'page2.png']
+
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    assert convert_single_file(cbz_path, str(output_dir), 'cbz')
+    with zipfile.ZipFile(output_dir / 'book.cbz') as archive:
+        pages = [name for name in archive.namelist() if name.endswith('.jpeg')]
+    assert len(pages) == len(READING_ORDER) - 1
@@ -0,0 +1,25 @@
+import os
+
+from PIL import Image
+
+from converter import convert_multiple_files
+from scheduler import CostModel, estimate_job
+
+
+def test_unmeasurable_books_get_a_minimal_estimate(tmp_path):
+    estimate = estimate_job(str(tmp_path / 'gone.cbz'), CostModel())
+    assert (estimate.size, estimate.pages) == (0, 1)
+
+
+def test_missing_files_fail_alone(tmp_path):
+    book = tmp_path / 'folderbook'
+    book.mkdir()
+    Image.new('RGB', (20, 20)).save(book / '1.jpg')
+    os.symlink(tmp_path / 'nonexistent.jpg', book / '2.jpg')
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+
+    progress = convert_multiple_files([str(tmp_path / 'gone.cbz'), str(book)], str(output_dir), 'cbz')
+    assert progress.success_count == 1
+    assert progress.error_count == 1
+    assert (output_dir / 'folderbook.cbz').is_file()
@@ -0,0 +1,52 @@
+import io
+
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image
+
+from converter import convert_single_file
+from scheduler import count_pages
+from verify import expected_page_counts, find_outputs, verify_output
+
+
+def _jpeg(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (30, 40), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def reused_image_pdf(tmp_path):
+    """Four-page PDF whose last page reuses the first page's image"""
+    source = tmp_path / 'source'
+    source.mkdir()
+    document = fitz.open()
+    first_xref = None
+    for index, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255), None]):
+        page = document.new_page(width=30, height=40)
+        if color is None:
+            page.insert_image(page.rect, xref=first_xref)
+        else:
+            xref = page.insert_image(page.rect, stream=_jpeg(color))
+            first_xref = first_xref or xref
+    path = source / 'book.pdf'
+    document.save(path)
+    document.close()
+    return str(path)
+
+
+def test_pdf_pages_are_counted_by_unique_image(reused_image_pdf):
+    assert count_pages(reused_image_pdf) == 3
+
+
+@pytest.mark.parametrize('output_type', ['cbz', 'pdf', 'epub', 'images'])
+def test_outputs_of_pdf_with_reused_image_verify(tmp_path, reused_image_pdf, output_type):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    assert convert_single_file(reused_image_pdf, str(output_dir), output_type)
+    outputs = find_outputs(str(output_dir))
+    expected = expected_page_counts(outputs, [reused_image_pdf])
+    assert list(expected.values()) == [3]
+    for output in outputs:
+        result = verify_output(output, expected[output])
+        assert result.ok, result.problems
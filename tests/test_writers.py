@@ -0,0 +1,60 @@
+import io
+import zipfile
+
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image
+
+from converter import convert_single_file
+from profiles import parse_profile
+from readers import Page
+from verify import find_outputs, verify_output
+from writers import PDF_SAVE_PROFILES, EpubWriter
+
+
+def test_pdf_save_profiles():
+    assert parse_profile('pdf:save=fast').writer_options == {'save': 'fast'}
+    assert not any(options.get('linear') for options in PDF_SAVE_PROFILES.values())
+
+
+@pytest.mark.parametrize('spec', ['pdf:save=linearized', 'pdf:save=smallest'])
+def test_unavailable_pdf_save_profiles_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_profile(spec)
+
+
+def _encoded(image, image_format) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def jpeg2000_pdf(tmp_path):
+    """Two-page PDF: a JPEG page and a JPEG 2000 page (kept as .jpx when passed through)"""
+    document = fitz.open()
+    for data in [_encoded(Image.new('RGB', (30, 40), (200, 0, 0)), 'JPEG'),
+                 _encoded(Image.new('RGB', (30, 40), (0, 200, 0)), 'JPEG2000')]:
+        page = document.new_page(width=30, height=40)
+        page.insert_image(page.rect, stream=data)
+    path = tmp_path / 'book.pdf'
+    document.save(path)
+    document.close()
+    return str(path)
+
+
+@pytest.mark.parametrize('output_type', ['cbz', 'epub', 'images'])
+def test_passed_through_pages_use_standard_formats(tmp_path, jpeg2000_pdf, output_type):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    assert convert_single_file(jpeg2000_pdf, str(output_dir), output_type, verify=True)
+    output = find_outputs(str(output_dir))[0]
+    assert verify_output(output, 2).ok
+
+
+def test_epub_converts_other_image_types(tmp_path):
+    writer = EpubWriter(str(tmp_path / 'book.epub'), lambda message: None)
+    writer.add_page(Page(0, '000.bmp', _encoded(Image.new('RGB', (30, 40)), 'BMP')))
+    assert writer.close()
+    with zipfile.ZipFile(tmp_path / 'book.epub') as archive:
+        assert 'OEBPS/images/000.png' in archive.namelist()